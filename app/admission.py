@@ -0,0 +1,195 @@
+# app/admission.py
+"""
+Допуск запросов и сброс нагрузки
+
+Запросы к роутерам books и categories делятся на классы: чтение (GET, HEAD)
+и запись (остальные методы). У каждого класса свой предел одновременно
+выполняющихся запросов и ограниченная очередь ожидания. Запрос, который
+не дождался допуска за ADMISSION_QUEUE_TIMEOUT секунд или застал полную
+очередь, сразу получает 503 с Retry-After. Так при замедлении БД запросы
+не копятся в ожидании соединений пула, а задержка принятых запросов
+остается ограниченной.
+
+Пределы по умолчанию привязаны к пулу соединений: чтению — весь пул
+с overflow, записи — DB_POOL_SIZE. Служебные маршруты (/health, /live,
+/ready, /metrics, документация) не ограничиваются.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from app.db.db import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from app.metrics import (
+    ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED
+)
+
+# Включение ограничителя и пределы по классам маршрутов
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", str(DB_POOL_SIZE)))
+# Размер очереди ожидания (по умолчанию — два предела класса)
+ADMISSION_READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE", str(ADMISSION_READ_LIMIT * 2)))
+ADMISSION_WRITE_QUEUE = int(os.getenv("ADMISSION_WRITE_QUEUE", str(ADMISSION_WRITE_LIMIT * 2)))
+# Срок ожидания в очереди, секунды
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1"))
+# Значение Retry-After в ответе 503, секунды
+ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Ограничиваемые маршруты (префиксы путей)
+LIMITED_PREFIXES = ("/books", "/categories")
+# Методы класса чтения
+READ_METHODS = ("GET", "HEAD")
+
+
+class AdmissionLimiter:
+    """
+    Предел одновременных запросов с ограниченной FIFO-очередью
+
+    Освободившийся слот передается первому ожидающему напрямую, поэтому
+    новые запросы не обгоняют очередь.
+    """
+
+    def __init__(self, route_class: str, limit: int, queue_size: int, timeout: float):
+        self.route_class = route_class
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> Optional[str]:
+        """Получение слота; None — запрос допущен, иначе причина отказа"""
+        if self.active < self.limit and not self._waiters:
+            self._admit(0.0)
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return self._reject("queue_full")
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._report_queue()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._forget(future)
+            return self._reject("timeout")
+        except BaseException:
+            # Клиент отключился: слот, который успели передать, возвращаем
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._forget(future)
+            raise
+        # Слот передан из release(): active уже учитывает этот запрос
+        self._admit(time.perf_counter() - started, transferred=True)
+        return None
+
+    def release(self):
+        """Освобождение слота: передача первому ожидающему или уменьшение active"""
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self._report_queue()
+                return
+        self.active -= 1
+        ADMISSION_IN_FLIGHT.set(self.route_class, value=self.active)
+
+    def _admit(self, waited: float, transferred: bool = False):
+        if not transferred:
+            self.active += 1
+        self.admitted += 1
+        ADMISSION_IN_FLIGHT.set(self.route_class, value=self.active)
+        ADMISSION_QUEUE_WAIT.observe(self.route_class, value=waited)
+
+    def _reject(self, reason: str) -> str:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.inc(self.route_class, reason)
+        return reason
+
+    def _forget(self, future: asyncio.Future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+        self._report_queue()
+
+    def _report_queue(self):
+        ADMISSION_QUEUE_DEPTH.set(self.route_class, value=len(self._waiters))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "queue_timeout": self.timeout,
+            "in_flight": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+limiters = {
+    "read": AdmissionLimiter("read", ADMISSION_READ_LIMIT, ADMISSION_READ_QUEUE,
+                             ADMISSION_QUEUE_TIMEOUT),
+    "write": AdmissionLimiter("write", ADMISSION_WRITE_LIMIT, ADMISSION_WRITE_QUEUE,
+                              ADMISSION_QUEUE_TIMEOUT),
+}
+
+
+def route_class(scope) -> Optional[str]:
+    """Класс маршрута запроса или None, если запрос не ограничивается"""
+    if not scope["path"].startswith(LIMITED_PREFIXES):
+        return None
+    return "read" if scope["method"] in READ_METHODS else "write"
+
+
+def admission_stats() -> dict:
+    """Состояние ограничителя для диагностики"""
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "retry_after": ADMISSION_RETRY_AFTER,
+        **{name: limiter.stats() for name, limiter in limiters.items()},
+    }
+
+
+class AdmissionMiddleware:
+    """
+    Допуск запросов по классам маршрутов; при перегрузке — 503 с Retry-After
+
+    Слот занят до конца отправки ответа, включая потоковую выгрузку,
+    которая все это время держит соединение с БД.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        name = route_class(scope) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = limiters[name]
+        reason = await limiter.acquire()
+        if reason is not None:
+            response = JSONResponse(
+                {"detail": "Сервис перегружен, повторите запрос позже"},
+                status_code=503,
+                headers={"Retry-After": str(math.ceil(ADMISSION_RETRY_AFTER))},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -1,76 +1,369 @@
 # app/api/books.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional, Union
+import csv
+import io
+import json
 
 from app.db import crud, models
 from app.db.db import get_db
-from app.schemas import Book, BookCreate, BookUpdate
+from app.db.replica import get_read_db, read_session
+from app.db.pagination import InvalidCursor, next_cursor
+from app.query_budget import query_budget
+from app.api.conditional import (
+    as_utc, is_not_modified, make_etag, not_modified_response, set_validators
+)
+from app.api.importers import iter_csv_records, iter_ndjson_records
+from app.api.serialization import (
+    book_cached_payload, book_row_payload, books_payload, fast_json_response, parse_fields
+)
+from app.schemas import (
+    Book, BookBatchIds, BookBatchResult, BookBatchUpdate, BookCreate,
+    BookImportError, BookImportReport, BookSearchPage, BookUpdate
+)
 
 router = APIRouter(prefix="/books", tags=["books"])
 
-@router.get("/", response_model=List[Book])
-def read_books(
+# Размер пачки для массового импорта и предел ошибок в отчете
+BULK_BATCH_SIZE = 1000
+BULK_MAX_REPORTED_ERRORS = 1000
+
+# Размер пачки серверного курсора и порог отправки фрагмента при выгрузке
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def _facets_payload(found: dict) -> dict:
+    """Фасеты crud.search_books_with_facets в формате схемы BookFacets"""
+    payload = {}
+    if "category" in found:
+        payload["category"] = [
+            {"id": category_id, "title": title, "count": count}
+            for category_id, title, count in found["category"]
+        ]
+    if "price" in found:
+        bounds = (0,) + models.PRICE_HISTOGRAM_BOUNDS + (None,)
+        payload["price"] = [
+            {"min": float(low), "max": high if high is None else float(high), "count": count}
+            for low, high, count in zip(bounds, bounds[1:], found["price"])
+        ]
+    return payload
+
+@router.get("/", response_model=Union[List[Book], BookSearchPage])
+@query_budget(2)
+async def read_books(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы"),
+    sort: Literal["id", "price"] = Query("id", description="Ключ сортировки"),
     category_id: Optional[int] = Query(None, description="Фильтр по ID категории"),
     title: Optional[str] = Query(None, description="Поиск по названию"),
+    q: Optional[str] = Query(None, min_length=1, max_length=200,
+                             description="Полнотекстовый поиск по названию и описанию"),
     min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
     max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Поля ответа через запятую"),
+    facets: Optional[str] = Query(None, description="Фасеты через запятую: category, price"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список книг
     
     - **skip**: количество записей для пропуска (пагинация)
     - **limit**: максимальное количество возвращаемых записей
+    - **cursor**: курсор из заголовка `X-Next-Cursor` предыдущего ответа
+    - **sort**: сортировка по `id` или по `price` (затем по `id`)
     - **category_id**: фильтрация по категории
     - **title**: поиск по названию (регистронезависимый)
+    - **q**: полнотекстовый поиск по названию и описанию с учетом опечаток,
+      результаты сортируются по релевантности (только с **skip**, без **cursor**)
     - **min_price**: минимальная цена
     - **max_price**: максимальная цена
+    - **fields**: только перечисленные поля книги, например `id,title,price`;
+      из БД читаются только нужные колонки
+    - **facets**: `category` и/или `price` — ответ становится объектом
+      `{"items": [...], "facets": {...}}` с количеством найденных книг по
+      категориям и корзинам цен (по всем фильтрам, без пагинации); страница
+      и фасеты читаются одним SQL-запросом
+    
+    Ответ содержит ETag. На запрос с совпадающим If-None-Match возвращается
+    304 по ID и отметкам изменения строк страницы, без чтения описаний
+    и сериализации.
     """
-    if any([title, category_id, min_price, max_price]):
-        # Используем поиск с фильтрами
-        books = crud.search_books(
-            db=db,
-            title=title,
-            category_id=category_id,
-            min_price=min_price,
-            max_price=max_price,
-            skip=skip,
-            limit=limit
+    if q and cursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Параметр cursor нельзя использовать вместе с q"
+        )
+    
+    filters = {
+        "title": title,
+        "category_id": category_id,
+        "min_price": min_price,
+        "max_price": max_price,
+        "q": q,
+    }
+    page = {"skip": skip, "limit": limit, "cursor": cursor, "sort": sort}
+    selected = parse_fields(fields)
+    requested_facets = parse_fields(facets, crud.BOOK_FACETS, "фасеты")
+    
+    if requested_facets:
+        return await _read_books_with_facets(
+            request, response, db, filters, page, selected, requested_facets
         )
+    
+    try:
+        # Клиент с закэшированной страницей: проверяем только версии строк страницы
+        if request.headers.get("if-none-match"):
+            fingerprint = await crud.get_books_page_fingerprint(db, **filters, **page)
+            etag = make_etag("books", selected, *fingerprint)
+            if is_not_modified(request, etag):
+                return not_modified_response(etag)
+        
+        # Строки вместо ORM-объектов: ответ собирается без валидации response_model
+        books = await crud.get_books_rows(db, fields=selected, **filters, **page)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    set_validators(response, make_etag("books", selected, *crud.books_rows_fingerprint(books)))
+    
+    # Курсор следующей страницы отдаем в заголовке, чтобы не менять формат ответа
+    cursor_value = None if q else next_cursor(books, crud.BOOK_SORT_KEYS[sort], sort, limit)
+    if cursor_value:
+        response.headers["X-Next-Cursor"] = cursor_value
+    
+    return fast_json_response(books_payload(books, selected), response)
+
+async def _read_books_with_facets(request: Request, response: Response, db: AsyncSession,
+                                  filters: dict, page: dict, selected, requested_facets):
+    """Страница книг с фасетами (facets=...) одним запросом"""
+    try:
+        books, found = await crud.search_books_with_facets(
+            db, requested_facets, fields=selected, **filters, **page
+        )
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    # Фасеты зависят от всех найденных книг, поэтому 304 проверяется после запроса
+    etag = make_etag("books", selected, found, *crud.books_rows_fingerprint(books))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    set_validators(response, etag)
+    
+    cursor_value = None if filters["q"] else next_cursor(
+        books, crud.BOOK_SORT_KEYS[page["sort"]], page["sort"], page["limit"]
+    )
+    if cursor_value:
+        response.headers["X-Next-Cursor"] = cursor_value
+    
+    return fast_json_response(
+        {"items": books_payload(books, selected), "facets": _facets_payload(found)},
+        response
+    )
+
+async def _export_rows(request: Request, export_format: str, filters: dict):
+    """Генератор фрагментов выгрузки в NDJSON или CSV"""
+    # Сессия живет, пока клиент читает поток, поэтому открывается здесь
+    async with read_session(request) as db:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == "csv":
+            writer.writerow(crud.EXPORT_COLUMNS)
+        
+        async for row in crud.iter_books_for_export(db, batch_size=EXPORT_BATCH_SIZE, **filters):
+            if export_format == "csv":
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(row._mapping), ensure_ascii=False))
+                buffer.write("\n")
+            
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        
+        if buffer.tell():
+            yield buffer.getvalue()
+
+@router.get("/export", response_class=StreamingResponse)
+@query_budget(1)
+async def export_books(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Формат выгрузки"),
+    category_id: Optional[int] = Query(None, description="Фильтр по ID категории"),
+    title: Optional[str] = Query(None, description="Поиск по названию"),
+    q: Optional[str] = Query(None, min_length=1, max_length=200,
+                             description="Полнотекстовый поиск по названию и описанию"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+):
+    """
+    Выгрузить каталог книг потоком
+    
+    - **format**: `ndjson` (по умолчанию) или `csv`
+    - фильтры такие же, как у списка книг
+    
+    Книги читаются одним запросом через серверный курсор и отправляются
+    по мере чтения, без загрузки всего каталога в память.
+    """
+    filters = {
+        "title": title,
+        "category_id": category_id,
+        "min_price": min_price,
+        "max_price": max_price,
+        "q": q,
+    }
+    if format == "csv":
+        media_type = "text/csv; charset=utf-8"
     else:
-        # Просто получаем все книги
-        books = crud.get_books(db, skip=skip, limit=limit)
+        media_type = "application/x-ndjson"
     
-    return books
+    return StreamingResponse(
+        _export_rows(request, format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=books.{format}"}
+    )
+
+def _batch_result(book_id: int, status_code: int, detail: Optional[str] = None,
+                  book: Optional[dict] = None) -> dict:
+    """Результат пакетной операции для одной книги (формат BookBatchResult)"""
+    return {"id": book_id, "status": status_code, "detail": detail, "book": book}
+
+@router.post("/batch-get", response_model=List[BookBatchResult])
+@query_budget(1)
+async def batch_get_books(
+    batch: BookBatchIds,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получить много книг одним запросом
+    
+    - **ids**: ID книг (до BOOK_BATCH_MAX_ITEMS)
+    
+    Результаты возвращаются в порядке ids: статус 200 с книгой или 404.
+    """
+    books = await crud.get_books_by_ids(db, batch.ids)
+    results = [
+        _batch_result(book_id, status.HTTP_200_OK, book=book_row_payload(books[book_id]))
+        if book_id in books else
+        _batch_result(book_id, status.HTTP_404_NOT_FOUND, f"Книга с ID {book_id} не найдена")
+        for book_id in batch.ids
+    ]
+    return fast_json_response(results)
+
+@router.patch("/batch", response_model=List[BookBatchResult])
+@query_budget(6)
+async def batch_update_books(
+    batch: BookBatchUpdate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Частично обновить много книг в одной транзакции
+    
+    - **items**: изменения книг; в каждом `id` и только изменяемые поля
+      (`title`, `description`, `price`, `url`, `category_id`)
+    
+    Корректные изменения применяются одним массовым UPDATE. Поля `title`,
+    `price` и `category_id` нельзя передать как null. Для каждого
+    элемента возвращается статус: 200, 404 (книги нет) или 400 (нет
+    категории, название уже занято, ID повторяется в запросе).
+    """
+    patches = [item.model_dump(exclude_unset=True) for item in batch.items]
+    errors = await crud.batch_update_books(db, patches)
+    
+    results = []
+    for index, patch in enumerate(patches):
+        error = errors.get(index)
+        if error is None:
+            results.append(_batch_result(patch["id"], status.HTTP_200_OK))
+        elif isinstance(error, crud.BookNotFound):
+            results.append(_batch_result(patch["id"], status.HTTP_404_NOT_FOUND, str(error)))
+        else:
+            results.append(_batch_result(patch["id"], status.HTTP_400_BAD_REQUEST, str(error)))
+    return fast_json_response(results)
+
+@router.post("/batch-delete", response_model=List[BookBatchResult])
+@query_budget(3)
+async def batch_delete_books(
+    batch: BookBatchIds,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Удалить много книг одним запросом
+    
+    - **ids**: ID книг (до BOOK_BATCH_MAX_ITEMS)
+    
+    Для каждой книги возвращается статус 204 (удалена) или 404.
+    """
+    deleted = await crud.batch_delete_books(db, batch.ids)
+    results = [
+        _batch_result(book_id, status.HTTP_204_NO_CONTENT)
+        if book_id in deleted else
+        _batch_result(book_id, status.HTTP_404_NOT_FOUND, f"Книга с ID {book_id} не найдена")
+        for book_id in batch.ids
+    ]
+    return fast_json_response(results)
 
 @router.get("/{book_id}", response_model=Book)
-def read_book(
+@query_budget(1)
+async def read_book(
     book_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Поля ответа через запятую"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить книгу по ID
     
     - **book_id**: ID книги
+    - **fields**: только перечисленные поля книги, например `id,title,price`
+    
+    Поддерживаются условные запросы по If-None-Match и If-Modified-Since.
     """
-    db_book = crud.get_book_by_id(db, book_id=book_id)
-    if db_book is None:
+    selected = parse_fields(fields)
+    book = await crud.get_book_cached(db, book_id=book_id)
+    if book is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Книга с ID {book_id} не найдена"
         )
     
-    return db_book
+    # Ответ включает категорию, поэтому учитываем изменения обеих записей
+    category = book["category"]
+    versions = [book["updated_at"]] + ([category["updated_at"]] if category else [])
+    etag = make_etag("book", book["id"], selected, *versions)
+    last_modified = max(as_utc(version) for version in versions)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    set_validators(response, etag, last_modified)
+    return fast_json_response(book_cached_payload(book, selected), response)
+
+def _constraint_error(error: crud.ConstraintViolation, book: BookCreate) -> HTTPException:
+    """Ответ 400 на нарушение ограничений БД при записи книги"""
+    if isinstance(error, crud.MissingCategory):
+        detail = f"Категория с ID {book.category_id} не существует"
+    else:
+        detail = f"Книга с названием '{book.title}' уже существует в этой категории"
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
 
 @router.post("/", 
              response_model=Book, 
              status_code=status.HTTP_201_CREATED)
-def create_book(
+@query_budget(4)
+async def create_book(
     book: BookCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Создать новую книгу
@@ -81,40 +374,80 @@ def create_book(
     - **url**: ссылка на книгу
     - **category_id**: ID категории (обязательно)
     """
-    # Проверяем существование категории
-    db_category = crud.get_category_by_id(db, category_id=book.category_id)
-    if db_category is None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Категория с ID {book.category_id} не существует"
+    # Уникальность названия и существование категории проверяет БД
+    try:
+        return await crud.create_book(
+            db=db,
+            title=book.title,
+            description=book.description,
+            price=book.price,
+            category_id=book.category_id,
+            url=book.url
         )
+    except crud.ConstraintViolation as e:
+        raise _constraint_error(e, book)
+
+@router.post("/bulk", response_model=BookImportReport)
+@query_budget(None)
+async def bulk_create_books(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Массовый импорт книг из потока NDJSON или CSV
     
-    # Проверяем, нет ли уже книги с таким названием в этой категории
-    existing_book = db.query(models.Book).filter(
-        models.Book.title == book.title,
-        models.Book.category_id == book.category_id
-    ).first()
+    - **Content-Type: application/x-ndjson**: один JSON-объект книги на строку
+    - **Content-Type: text/csv**: CSV с заголовком `title,description,price,url,category_id`
     
-    if existing_book:
+    Файл читается потоково и записывается пачками по BULK_BATCH_SIZE строк,
+    каждая пачка фиксируется отдельной транзакцией. Ошибочные строки
+    пропускаются и попадают в отчет.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "text/csv":
+        records = iter_csv_records(request.stream())
+    elif content_type in ("application/x-ndjson", "application/jsonl", "application/json"):
+        records = iter_ndjson_records(request.stream())
+    else:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Книга с названием '{book.title}' уже существует в этой категории"
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Поддерживаются только application/x-ndjson и text/csv"
         )
     
-    return crud.create_book(
-        db=db,
-        title=book.title,
-        description=book.description,
-        price=book.price,
-        category_id=book.category_id,
-        url=book.url
-    )
+    report = BookImportReport()
+    
+    def add_error(row_number: int, detail: str):
+        report.failed += 1
+        if len(report.errors) < BULK_MAX_REPORTED_ERRORS:
+            report.errors.append(BookImportError(row=row_number, detail=detail))
+        else:
+            report.errors_truncated = True
+    
+    async def flush(batch):
+        inserted, errors = await crud.bulk_create_books(db, batch)
+        report.inserted += inserted
+        for row_number, detail in errors:
+            add_error(row_number, detail)
+    
+    batch = []
+    async for row_number, values, error in records:
+        if error is not None:
+            add_error(row_number, error)
+            continue
+        batch.append((row_number, values))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    await flush(batch)
+    
+    return report
 
 @router.put("/{book_id}", response_model=Book)
-def update_book(
+@query_budget(5)
+async def update_book(
     book_id: int,
     book: BookUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обновить книгу
@@ -126,61 +459,40 @@ def update_book(
     - **url**: новая ссылка на книгу
     - **category_id**: новая категория книги
     """
-    db_book = crud.get_book_by_id(db, book_id=book_id)
+    try:
+        db_book = await crud.update_book(
+            db=db,
+            book_id=book_id,
+            title=book.title,
+            description=book.description,
+            price=book.price,
+            category_id=book.category_id,
+            url=book.url
+        )
+    except crud.ConstraintViolation as e:
+        raise _constraint_error(e, book)
+    
     if db_book is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Книга с ID {book_id} не найдена"
         )
-    
-    # Проверяем существование новой категории (если она меняется)
-    if book.category_id != db_book.category_id:
-        db_category = crud.get_category_by_id(db, category_id=book.category_id)
-        if db_category is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Категория с ID {book.category_id} не существует"
-            )
-    
-    # Проверяем, нет ли другой книги с таким названием в новой категории
-    existing_book = db.query(models.Book).filter(
-        models.Book.title == book.title,
-        models.Book.category_id == book.category_id,
-        models.Book.id != book_id
-    ).first()
-    
-    if existing_book:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Книга с названием '{book.title}' уже существует в этой категории"
-        )
-    
-    return crud.update_book(
-        db=db,
-        book_id=book_id,
-        title=book.title,
-        description=book.description,
-        price=book.price,
-        category_id=book.category_id,
-        url=book.url
-    )
+    return db_book
 
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_book(
+@query_budget(3)
+async def delete_book(
     book_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Удалить книгу
     
     - **book_id**: ID книги для удаления
     """
-    db_book = crud.get_book_by_id(db, book_id=book_id)
-    if db_book is None:
+    if not await crud.delete_book(db=db, book_id=book_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Книга с ID {book_id} не найдена"
         )
-    
-    crud.delete_book(db=db, book_id=book_id)
     return None
\ No newline at end of file
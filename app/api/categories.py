@@ -1,86 +1,183 @@
 # app/api/categories.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 from app.db import crud, models
 from app.db.db import get_db
-from app.schemas import Category, CategoryCreate, CategoryUpdate
+from app.db.replica import get_read_db
+from app.db.pagination import InvalidCursor, next_cursor
+from app.query_budget import query_budget
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_validators
+from app.schemas import Category, CategoryCreate, CategoryStats, CategoryUpdate
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
 @router.get("/", response_model=List[Category])
-def read_categories(
+@query_budget(1)
+async def read_categories(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить список категорий
     
     - **skip**: количество записей для пропуска (пагинация)
     - **limit**: максимальное количество возвращаемых записей
+    - **cursor**: курсор из заголовка `X-Next-Cursor` предыдущего ответа
     """
-    categories = crud.get_categories(db, skip=skip, limit=limit)
+    try:
+        categories = await crud.get_categories(db, skip=skip, limit=limit, cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
-    # Добавляем количество книг в каждой категории
-    for category in categories:
-        category.books_count = len(category.books)
+    # Количество книг меняется без изменения категории, поэтому входит в ETag
+    etag = make_etag("categories", *(
+        (category.id, category.updated_at, category.books_count) for category in categories
+    ))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    set_validators(response, etag)
+    
+    cursor_value = next_cursor(categories, crud.CATEGORY_SORT_KEYS["id"], "id", limit)
+    if cursor_value:
+        response.headers["X-Next-Cursor"] = cursor_value
     
     return categories
 
+def _stats_payload(row) -> dict:
+    """Строка crud.get_category_stats в формате схемы CategoryStats"""
+    bounds = (0,) + models.PRICE_HISTOGRAM_BOUNDS + (None,)
+    return {
+        "category_id": row.category_id,
+        "title": row.title,
+        "books_count": row.books_count,
+        "price_min": row.price_min,
+        "price_max": row.price_max,
+        "price_avg": row.price_sum / row.books_count if row.books_count else None,
+        "histogram": [
+            {"min": low, "max": high, "count": getattr(row, column.key)}
+            for low, high, column in zip(bounds, bounds[1:], models.PRICE_BUCKET_COLUMNS)
+        ],
+    }
+
+def _stats_etag(rows) -> str:
+    """ETag сводки: время пересчета и название каждой категории"""
+    return make_etag("category-stats", *((row.category_id, row.title, row.updated_at) for row in rows))
+
+@router.get("/stats", response_model=List[CategoryStats])
+@query_budget(1)
+async def read_categories_stats(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получить статистику по категориям
+    
+    - **skip**: количество записей для пропуска (пагинация)
+    - **limit**: максимальное количество возвращаемых записей
+    
+    Для каждой категории: количество книг, минимальная, максимальная и средняя
+    цена и гистограмма цен. Читается из сводной таблицы, без обхода книг.
+    """
+    rows = await crud.get_category_stats(db, skip=skip, limit=limit)
+    etag = _stats_etag(rows)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    set_validators(response, etag)
+    return [_stats_payload(row) for row in rows]
+
+@router.get("/{category_id}/stats", response_model=CategoryStats)
+@query_budget(1)
+async def read_category_stats(
+    category_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получить статистику категории
+    
+    - **category_id**: ID категории
+    """
+    rows = await crud.get_category_stats(db, category_id=category_id)
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Категория с ID {category_id} не найдена"
+        )
+    
+    etag = _stats_etag(rows)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    set_validators(response, etag)
+    return _stats_payload(rows[0])
+
 @router.get("/{category_id}", response_model=Category)
-def read_category(
+@query_budget(1)
+async def read_category(
     category_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить категорию по ID
     
     - **category_id**: ID категории
     """
-    db_category = crud.get_category_by_id(db, category_id=category_id)
+    # Количество книг считается в том же запросе
+    db_category = await crud.get_category_by_id(db, category_id=category_id, with_books_count=True)
     if db_category is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Категория с ID {category_id} не найдена"
         )
     
-    # Добавляем количество книг
-    db_category.books_count = len(db_category.books)
+    etag = make_etag("category", db_category.id, db_category.updated_at, db_category.books_count)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    set_validators(response, etag)
     
     return db_category
 
 @router.post("/", 
              response_model=Category, 
              status_code=status.HTTP_201_CREATED)
-def create_category(
+@query_budget(1)
+async def create_category(
     category: CategoryCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Создать новую категорию
     
     - **title**: название категории (обязательно)
     """
-    # Проверяем, нет ли уже категории с таким названием
-    existing_category = db.query(models.Category).filter(
-        models.Category.title == category.title
-    ).first()
-    
-    if existing_category:
+    try:
+        return await crud.create_category(db=db, title=category.title)
+    except crud.DuplicateTitle:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Категория с названием '{category.title}' уже существует"
         )
-    
-    return crud.create_category(db=db, title=category.title)
 
 @router.put("/{category_id}", response_model=Category)
-def update_category(
+@query_budget(1)
+async def update_category(
     category_id: int,
     category: CategoryUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обновить категорию
@@ -88,45 +185,38 @@ def update_category(
     - **category_id**: ID категории для обновления
     - **title**: новое название категории
     """
-    db_category = crud.get_category_by_id(db, category_id=category_id)
-    if db_category is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Категория с ID {category_id} не найдена"
+    # Уникальность названия проверяет БД, количество книг возвращается тем же запросом
+    try:
+        db_category = await crud.update_category(
+            db=db, 
+            category_id=category_id, 
+            title=category.title
         )
-    
-    # Проверяем, нет ли другой категории с таким названием
-    existing_category = db.query(models.Category).filter(
-        models.Category.title == category.title,
-        models.Category.id != category_id
-    ).first()
-    
-    if existing_category:
+    except crud.DuplicateTitle:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Категория с названием '{category.title}' уже существует"
         )
     
-    updated_category = crud.update_category(
-        db=db, 
-        category_id=category_id, 
-        title=category.title
-    )
-    
-    updated_category.books_count = len(updated_category.books)
-    return updated_category
+    if db_category is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Категория с ID {category_id} не найдена"
+        )
+    return db_category
 
 @router.delete("/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_category(
+@query_budget(4)
+async def delete_category(
     category_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Удалить категорию
     
     - **category_id**: ID категории для удаления
     """
-    db_category = crud.get_category_by_id(db, category_id=category_id)
+    db_category = await crud.get_category_by_id(db, category_id=category_id)
     if db_category is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -134,12 +224,12 @@ def delete_category(
         )
     
     # Проверяем, есть ли книги в категории
-    if len(db_category.books) > 0:
+    if await crud.category_has_books(db, category_id=category_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя удалить категорию, в которой есть книги. "
                    "Сначала удалите или переместите книги."
         )
     
-    crud.delete_category(db=db, category_id=category_id)
+    await crud.delete_category(db=db, category_id=category_id)
     return None
\ No newline at end of file
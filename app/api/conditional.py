@@ -0,0 +1,83 @@
+# app/api/conditional.py
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional, Union
+
+from fastapi import Request, Response, status
+
+
+def _normalize(value: Any) -> Any:
+    """Приведение значений к виду, не зависящему от драйвера БД"""
+    if isinstance(value, datetime):
+        return as_utc(value).isoformat()
+    if isinstance(value, (tuple, list)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def as_utc(value: Union[datetime, str]) -> datetime:
+    """Время в UTC (SQLite возвращает время без часового пояса)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def make_etag(*parts: Any) -> str:
+    """Слабый ETag из значений, определяющих содержимое ответа"""
+    digest = hashlib.sha1(repr([_normalize(part) for part in parts]).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Слабое сравнение ETag по RFC 9110"""
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in header.split(",")
+    )
+
+
+def is_not_modified(request: Request, etag: str,
+                    last_modified: Optional[datetime] = None) -> bool:
+    """
+    Проверка условных заголовков запроса
+
+    If-None-Match имеет приоритет: при его наличии If-Modified-Since
+    не учитывается.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def set_validators(response: Response, etag: str,
+                   last_modified: Optional[datetime] = None):
+    """Установка ETag и Last-Modified в ответ"""
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(
+            as_utc(last_modified).replace(microsecond=0), usegmt=True
+        )
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Пустой ответ 304 с валидаторами"""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,132 @@
+# app/api/importers.py
+import csv
+import json
+from typing import AsyncIterator, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas import BookCreate
+
+# Запись входного файла: номер строки, проверенные данные книги или ошибка
+ImportRecord = Tuple[int, Optional[dict], Optional[str]]
+# Строка файла: текст или ошибка чтения (тогда текст None)
+ImportLine = Tuple[Optional[str], Optional[str]]
+
+# Предел длины одной строки файла: больше в памяти не копится
+MAX_LINE_BYTES = 1024 * 1024
+
+
+def _decode(line: bytes) -> ImportLine:
+    """Строка файла в UTF-8 или ошибка чтения"""
+    if len(line) > MAX_LINE_BYTES:
+        return None, f"Строка длиннее {MAX_LINE_BYTES} байт"
+    try:
+        return line.decode("utf-8-sig").rstrip("\r"), None
+    except UnicodeDecodeError as e:
+        return None, f"Строка не в кодировке UTF-8 (байт {e.start + 1})"
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[ImportLine]:
+    """
+    Разбиение потока байтов на строки без чтения всего тела в память
+
+    Строка без перевода строки копится не дольше MAX_LINE_BYTES: дальше она
+    отбрасывается до конца и попадает в отчет ошибкой, как и строка не в UTF-8.
+    """
+    buffer = b""
+    # Текущая строка уже превысила предел, ее остаток пропускается
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield _decode(line)
+        if len(buffer) > MAX_LINE_BYTES:
+            if not skipping:
+                yield None, f"Строка длиннее {MAX_LINE_BYTES} байт"
+                skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield _decode(buffer)
+
+
+def _validate(row_number: int, data) -> ImportRecord:
+    """Проверка записи схемой BookCreate"""
+    if not isinstance(data, dict):
+        return row_number, None, "Ожидается объект с полями книги"
+    try:
+        book = BookCreate(**data)
+    except ValidationError as e:
+        details = "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in e.errors()
+        )
+        return row_number, None, details
+    values = book.model_dump()
+    values["url"] = values["url"] or ""
+    return row_number, values, None
+
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[ImportRecord]:
+    """Чтение книг из NDJSON: один JSON-объект на строку"""
+    row_number = 0
+    async for line, error in _iter_lines(chunks):
+        row_number += 1
+        if error is not None:
+            yield row_number, None, error
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Некорректный JSON: {e}"
+            continue
+        yield _validate(row_number, data)
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[ImportRecord]:
+    """
+    Чтение книг из CSV с заголовком
+
+    Поле в кавычках может содержать перевод строки, поэтому строки копятся,
+    пока число кавычек в записи не станет четным.
+    """
+    header = None
+    pending = []
+    pending_size = 0
+    quotes = 0
+    row_number = 0
+    async for line, error in _iter_lines(chunks):
+        row_number += 1
+        if error is not None:
+            # Нечитаемая строка обрывает и запись, которую она продолжала
+            pending, pending_size, quotes = [], 0, 0
+            yield row_number, None, error
+            continue
+        pending.append(line)
+        pending_size += len(line) + 1
+        quotes += line.count('"')
+        if quotes % 2:
+            if pending_size > MAX_LINE_BYTES:
+                # Незакрытая кавычка не должна копить в памяти весь файл
+                pending, pending_size, quotes = [], 0, 0
+                yield row_number, None, f"Запись длиннее {MAX_LINE_BYTES} байт"
+            continue
+        record = "\n".join(pending)
+        pending, pending_size, quotes = [], 0, 0
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield row_number, None, f"Ожидалось {len(header)} полей, получено {len(values)}"
+            continue
+        yield _validate(row_number, dict(zip(header, values)))
+    if pending:
+        yield row_number, None, "Незакрытая кавычка в конце файла"
@@ -0,0 +1,106 @@
+# app/api/serialization.py
+"""
+Быстрая сериализация ответов
+
+Маршрут, выбравший быстрый путь, сам собирает словари в формате схемы
+ответа (без валидации ORM-объектов через response_model) и возвращает
+fast_json_response. response_model при этом остается для OpenAPI.
+"""
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+# Без orjson быстрый путь сохраняется, но кодирует стандартным json
+FastJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+
+def category_payload(category_id: Optional[int], title: Optional[str],
+                     books_count: Optional[int] = None) -> Optional[dict]:
+    """Категория в формате схемы Category (порядок ключей как у Pydantic)"""
+    if category_id is None:
+        return None
+    return {"title": title, "id": category_id, "books_count": books_count}
+
+
+# Поля схемы Book в порядке сериализации Pydantic
+BOOK_FIELDS = ("title", "description", "price", "url", "category_id", "id", "category")
+
+# Значение каждого поля из строки запроса crud.get_books_rows
+BOOK_ROW_VALUES = {
+    "title": lambda row: row.title,
+    "description": lambda row: row.description,
+    "price": lambda row: float(row.price),
+    "url": lambda row: row.url,
+    "category_id": lambda row: row.category_id,
+    "id": lambda row: row.id,
+    "category": lambda row: category_payload(row.category_id, row.category_title),
+}
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str] = BOOK_FIELDS,
+                 noun: str = "поля") -> Optional[Tuple[str, ...]]:
+    """
+    Разбор списка имен через запятую (`id,title,price`)
+
+    Возвращает имена в порядке allowed (по умолчанию — поля схемы Book) или
+    None, если параметр не задан. noun — название списка в сообщении об ошибке.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестные {noun}: {', '.join(sorted(unknown)) or '(пусто)'}. "
+                   f"Допустимые {noun}: {', '.join(allowed)}"
+        )
+    return tuple(name for name in allowed if name in requested)
+
+
+def book_row_payload(row: Any, fields: Sequence[str] = BOOK_FIELDS) -> dict:
+    """Строка запроса crud.get_books_rows в формате схемы Book (только поля fields)"""
+    return {name: BOOK_ROW_VALUES[name](row) for name in fields}
+
+
+def book_cached_payload(data: dict, fields: Optional[Sequence[str]] = None) -> dict:
+    """Книга из кэша (crud.get_book_cached) в формате схемы Book"""
+    category = data["category"]
+    payload = {
+        "title": data["title"],
+        "description": data["description"],
+        "price": float(data["price"]),
+        "url": data["url"],
+        "category_id": data["category_id"],
+        "id": data["id"],
+        "category": category and category_payload(category["id"], category["title"]),
+    }
+    if fields is not None:
+        return {name: payload[name] for name in fields}
+    return payload
+
+
+def books_payload(rows: Iterable[Any], fields: Optional[Sequence[str]] = None) -> List[dict]:
+    return [book_row_payload(row, fields or BOOK_FIELDS) for row in rows]
+
+
+def fast_json_response(content: Any, response: Optional[Response] = None,
+                       status_code: int = 200) -> Response:
+    """
+    JSON-ответ без повторной валидации
+
+    Заголовки, выставленные обработчиком во внедренный Response
+    (ETag, X-Next-Cursor), переносятся в итоговый ответ.
+    """
+    result = FastJSONResponse(content, status_code=status_code)
+    if response is not None:
+        for name, value in response.headers.items():
+            if name != "content-length":
+                result.headers[name] = value
+    return result
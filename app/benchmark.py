@@ -0,0 +1,283 @@
+# app/benchmark.py
+"""
+Нагрузочный бенчмарк API на синтетическом каталоге
+
+Наполняет БД заданным числом книг, прогоняет ASGI-приложение в том же
+процессе с заданной конкурентностью и выводит p50/p95/p99, пропускную
+способность и число SQL-запросов на запрос для каждого эндпоинта.
+Кэш страниц, объединение запросов и ограничение допуска по умолчанию
+выключены (--page-cache, --coalesce, --admission включают их).
+
+Запускается модулем из корня проекта.
+
+Примеры:
+    python -m app.benchmark --database-url sqlite+aiosqlite:///./bench.db --books 100000
+    python -m app.benchmark --skip-seed --save-baseline bench_baseline.json
+    python -m app.benchmark --skip-seed --compare bench_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+# Только данные генератора: app.db здесь не импортируется, настройки задаются позже
+from app.generate_data import WORDS, generate_catalog
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк Bookstore API")
+    parser.add_argument("--database-url", help="URL БД (по умолчанию DATABASE_URL / DB_*)")
+    parser.add_argument("--books", type=int, default=10_000, help="Количество книг в каталоге")
+    parser.add_argument("--categories", type=int, default=50, help="Количество категорий")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора данных и запросов")
+    parser.add_argument("--skip-seed", action="store_true", help="Не наполнять БД (данные уже есть)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Число одновременных запросов")
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на каждый эндпоинт")
+    parser.add_argument("--warmup", type=int, default=20, help="Прогревочных запросов на эндпоинт")
+    parser.add_argument("--only", action="append", help="Запустить только указанные сценарии")
+    parser.add_argument("--no-cache", action="store_true", help="Отключить кэш сущностей")
+    parser.add_argument("--page-cache", action="store_true",
+                        help="Оставить кэш сжатых страниц (по умолчанию выключен)")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Оставить объединение одинаковых запросов (по умолчанию выключено)")
+    parser.add_argument("--admission", action="store_true",
+                        help="Оставить ограничение допуска запросов (по умолчанию выключено)")
+    parser.add_argument("--save-baseline", help="Сохранить результаты в JSON-файл")
+    parser.add_argument("--compare", help="Сравнить с сохраненным JSON-файлом")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Допустимое ухудшение p95 и пропускной способности (доля)")
+    return parser.parse_args(argv)
+
+
+# ========== Наполнение БД ==========
+
+async def seed_catalog(engine, categories: int, books: int, seed: int):
+    """Пересоздание таблиц и генерация синтетического каталога"""
+    await generate_catalog(
+        engine,
+        categories=categories,
+        books_per_category=max(books // categories, 1),
+        seed=seed,
+        drop=True,
+    )
+
+
+# ========== Сценарии ==========
+
+Scenario = Tuple[str, Callable[[random.Random], str]]
+
+
+def build_scenarios(books: int, categories: int) -> List[Scenario]:
+    """Эндпоинты и генераторы путей к ним"""
+    return [
+        ("books_list", lambda rng: "/books/?limit=50"),
+        ("books_list_deep_offset", lambda rng: f"/books/?limit=50&skip={max(books - 100, 0)}"),
+        ("books_by_category", lambda rng: f"/books/?limit=50&category_id={rng.randint(1, categories)}"),
+        ("books_price_range", lambda rng: "/books/?limit=50&min_price=1000&max_price=1500&sort=price"),
+        ("books_search_title", lambda rng: f"/books/?limit=50&title={rng.randint(1, books)}"),
+        ("books_search_q", lambda rng: f"/books/?limit=50&q={rng.choice(WORDS)}"),
+        ("book_by_id", lambda rng: f"/books/{rng.randint(1, books)}"),
+        ("categories_list", lambda rng: "/categories/?limit=100"),
+        ("category_by_id", lambda rng: f"/categories/{rng.randint(1, categories)}"),
+    ]
+
+
+# ========== Прогон ASGI-приложения в процессе ==========
+
+async def asgi_get(app, path: str) -> int:
+    """Выполнение GET-запроса к ASGI-приложению без сети, возвращает статус"""
+    raw_path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": raw_path,
+        "raw_path": raw_path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    status = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(app, path_factory, total: int, concurrency: int, seed: int) -> Dict:
+    """Прогон одного сценария: total запросов при заданной конкурентности"""
+    from app.query_budget import record_queries
+
+    rng = random.Random(seed)
+    paths = [path_factory(rng) for _ in range(total)]
+    latencies: List[float] = []
+    queries: List[int] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < len(paths):
+            path = paths[next_index]
+            next_index += 1
+            with record_queries() as recorder:
+                started = time.perf_counter()
+                status = await asgi_get(app, path)
+                latencies.append(time.perf_counter() - started)
+            queries.append(recorder.count)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(statistics.fmean(queries), 2) if queries else 0.0,
+    }
+
+
+# ========== Сравнение с базовой линией ==========
+
+def compare_results(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Список регрессий относительно сохраненных результатов"""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if base["p95_ms"] and result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} мс")
+        if base["throughput_rps"] and result["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{name}: пропускная способность {base['throughput_rps']} -> {result['throughput_rps']} rps"
+            )
+        if result["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(
+                f"{name}: SQL на запрос {base['queries_per_request']} -> {result['queries_per_request']}"
+            )
+    return regressions
+
+
+def print_table(results: Dict[str, Dict]):
+    header = f"{'сценарий':<24}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'rps':>10}{'SQL/запр':>10}{'ошибки':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<24}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['throughput_rps']:>10}{r['queries_per_request']:>10}{r['errors']:>8}")
+
+
+async def main(args: argparse.Namespace) -> int:
+    from app.db.db import engine
+    from app.main import app
+    from app import query_budget
+
+    query_budget.instrument_engine(engine.sync_engine)
+
+    try:
+        if not args.skip_seed:
+            print(f"Наполнение БД: {args.categories} категорий, {args.books} книг...")
+            started = time.perf_counter()
+            await seed_catalog(engine, args.categories, args.books, args.seed)
+            print(f"   готово за {time.perf_counter() - started:.1f} с")
+
+        scenarios = build_scenarios(args.books, args.categories)
+        if args.only:
+            scenarios = [s for s in scenarios if s[0] in args.only]
+
+        results = {}
+        for name, path_factory in scenarios:
+            if args.warmup:
+                await run_scenario(app, path_factory, args.warmup, args.concurrency, args.seed + 1)
+            results[name] = await run_scenario(
+                app, path_factory, args.requests, args.concurrency, args.seed
+            )
+    finally:
+        await engine.dispose()
+
+    print_table(results)
+    report = {
+        "meta": {
+            "database": engine.url.get_backend_name(),
+            "books": args.books,
+            "categories": args.categories,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "cache": not args.no_cache,
+            "page_cache": args.page_cache,
+            "coalesce": args.coalesce,
+            "admission": args.admission,
+        },
+        "results": results,
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print("❌ Обнаружены регрессии:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print("✅ Регрессий относительно базовой линии нет")
+    return 0
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    # Настройки читаются при импорте app.db.db, поэтому задаются до него
+    if arguments.database_url:
+        os.environ["DATABASE_URL"] = arguments.database_url
+    if arguments.no_cache:
+        os.environ["CACHE_ENABLED"] = "0"
+    # Повторяющиеся пути сценариев иначе отдаются из кэша страниц или ответом
+    # соседнего запроса, а ограничитель допуска отвечает 503 на высокой
+    # конкурентности: по умолчанию измеряется путь запроса до БД
+    os.environ["PAGE_CACHE_ENABLED"] = "1" if arguments.page_cache else "0"
+    os.environ["COALESCE_ENABLED"] = "1" if arguments.coalesce else "0"
+    os.environ["ADMISSION_ENABLED"] = "1" if arguments.admission else "0"
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,172 @@
+# app/coalescing.py
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+
+Пока выполняется GET /books/ или GET /books/{id}, такие же запросы (тот же
+путь, те же параметры в любом порядке, та же кодировка ответа) не идут
+в БД, а ждут первого и получают копию его ответа — один SQL-запрос и одна
+сериализация на всех. Ожидание ограничено COALESCE_MAX_WAIT секунд, после
+чего запрос выполняется сам. Ответ 5xx или прерванный ответ не делится:
+ожидавшие запросы выполняются сами.
+
+Не объединяются условные запросы (If-None-Match, If-Modified-Since) и
+запросы клиентов, читающих свои записи. Запрос, пришедший после записи
+в этом процессе, не присоединяется к начатому до нее.
+"""
+import asyncio
+import os
+import re
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.requests import Request
+
+from app.compression import page_cache
+from app.db.replica import is_sticky
+from app.metrics import COALESCED_REQUESTS
+
+# Включение объединения и предел ожидания чужого ответа, секунды
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", "2"))
+
+# Объединяемые маршруты
+COALESCE_PATHS = re.compile(r"^/books/(\d+)?$")
+# Заголовки, при которых ответ зависит от клиента
+CONDITIONAL_HEADERS = (b"if-none-match", b"if-modified-since")
+
+
+class Flight:
+    """Выполняющийся запрос и его ответ для ожидающих"""
+
+    __slots__ = ("done", "start", "body", "route")
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.start: Optional[dict] = None
+        self.body: Optional[bytes] = None
+        self.route = None
+
+    @property
+    def shareable(self) -> bool:
+        return self.body is not None and self.start["status"] < 500
+
+
+class SingleFlight:
+    """Выполняющиеся запросы по ключу и счетчики объединения"""
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def key(scope, headers: dict) -> str:
+        """Ключ: путь, нормализованные параметры, кодировка и поколение данных"""
+        query = urlencode(sorted(parse_qsl(scope["query_string"].decode("latin-1"),
+                                           keep_blank_values=True)))
+        encoding = headers.get(b"accept-encoding", b"").decode("latin-1")
+        return f"{scope['path']}?{query}#{encoding}@{page_cache.generation}"
+
+    def stats(self) -> dict:
+        return {
+            "enabled": COALESCE_ENABLED,
+            "max_wait": COALESCE_MAX_WAIT,
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "coalesced": self.shared,
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+        }
+
+
+single_flight = SingleFlight()
+
+
+def _coalescible(scope, headers: dict) -> bool:
+    if scope["method"] != "GET" or not COALESCE_PATHS.match(scope["path"]):
+        return False
+    if any(name in headers for name in CONDITIONAL_HEADERS):
+        return False
+    return not is_sticky(Request(scope))
+
+
+class CoalescingMiddleware:
+    """
+    Single-flight для GET /books/ и GET /books/{id}
+
+    Стоит снаружи ограничителя допуска (ожидающие не занимают слоты)
+    и сжатия (делится уже сжатое тело), но внутри CORS.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not _coalescible(scope, headers):
+            await self.app(scope, receive, send)
+            return
+
+        key = single_flight.key(scope, headers)
+        flight = single_flight.flights.get(key)
+        if flight is not None:
+            await self._follow(flight, scope, receive, send)
+            return
+
+        flight = Flight()
+        single_flight.flights[key] = flight
+        single_flight.leaders += 1
+
+        async def send_wrapper(message):
+            # Копии сообщений: внешние middleware (CORS) дописывают заголовки на месте
+            if message["type"] == "http.response.start":
+                flight.start = {**message, "headers": list(message.get("headers", []))}
+                flight.body = None
+            elif message["type"] == "http.response.body":
+                if message.get("more_body", False):
+                    # Потоковые ответы не делятся
+                    flight.start = None
+                elif flight.start is not None:
+                    flight.body = message.get("body", b"")
+                    flight.route = scope.get("route")
+                    # Ожидающие получают ответ, не дожидаясь отправки его первому клиенту
+                    self._land(key, flight)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._land(key, flight)
+
+    @staticmethod
+    def _land(key: str, flight: Flight):
+        if single_flight.flights.get(key) is flight:
+            del single_flight.flights[key]
+        flight.done.set()
+
+    async def _follow(self, flight: Flight, scope, receive, send):
+        """Ожидание ответа выполняющегося запроса"""
+        try:
+            await asyncio.wait_for(flight.done.wait(), COALESCE_MAX_WAIT)
+        except asyncio.TimeoutError:
+            single_flight.timeouts += 1
+            COALESCED_REQUESTS.inc("timeout")
+            await self.app(scope, receive, send)
+            return
+
+        if not flight.shareable:
+            single_flight.fallbacks += 1
+            COALESCED_REQUESTS.inc("fallback")
+            await self.app(scope, receive, send)
+            return
+
+        single_flight.shared += 1
+        COALESCED_REQUESTS.inc("shared")
+        scope["route"] = flight.route
+        await send({**flight.start, "headers": list(flight.start["headers"])})
+        await send({"type": "http.response.body", "body": flight.body})
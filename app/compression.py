@@ -0,0 +1,342 @@
+# app/compression.py
+"""
+Сжатие ответов и кэш сжатых страниц списка книг
+
+CompressionMiddleware сжимает ответы в zstd или gzip по заголовку
+Accept-Encoding клиента. Обычные ответы сжимаются целиком, если они не
+меньше COMPRESSION_MIN_SIZE байт; потоковые (выгрузка) — по мере отправки.
+
+Для самых запрашиваемых страниц GET /books/ готовые сжатые тела хранятся
+в PageCache: повторный запрос с той же строкой запроса отдается без
+обращения к БД, сериализации и сжатия. Кэш сбрасывается успешной записью
+книг или категорий в этом процессе; записи из других процессов он видит
+только по истечении PAGE_CACHE_TTL.
+"""
+import gzip
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.requests import Request
+
+from app.db.cache import LRUCache
+from app.db.replica import is_sticky
+from app.metrics import PAGE_CACHE_REQUESTS
+
+try:
+    import zstandard
+except ImportError:  # zstandard — необязательная зависимость
+    zstandard = None
+
+# Сжатие ответов: минимальный размер тела и уровни сжатия
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+# Кэш сжатых страниц: размер, время жизни, сколько запросов строки запроса
+# нужно в пределах TTL, чтобы ее страница попала в кэш, и предел размера тела
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1") == "1"
+PAGE_CACHE_MAXSIZE = int(os.getenv("PAGE_CACHE_MAXSIZE", "256"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "30"))
+PAGE_CACHE_MIN_REQUESTS = int(os.getenv("PAGE_CACHE_MIN_REQUESTS", "2"))
+PAGE_CACHE_MAX_BODY = int(os.getenv("PAGE_CACHE_MAX_BODY", str(1024 * 1024)))
+
+# Кэшируемые страницы и пути, запись в которые сбрасывает кэш
+PAGE_CACHE_PATHS = ("/books/",)
+PAGE_CACHE_INVALIDATING_PREFIXES = ("/books", "/categories")
+# Пути, где изменяющий метод (POST) только читает данные
+PAGE_CACHE_READ_ONLY_PATHS = ("/books/batch-get",)
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Кодировки в порядке предпочтения сервера
+ENCODINGS = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+# Заголовки, которые сохраняются в кэше вместе с телом
+CACHED_HEADERS = (
+    b"content-type", b"content-encoding", b"vary", b"etag", b"last-modified", b"x-next-cursor"
+)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Кодировка ответа по Accept-Encoding
+
+    Из поддерживаемых кодировок с ненулевым q выбирается кодировка
+    с наибольшим q, при равенстве — в порядке ENCODINGS.
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    candidates = [
+        (weights.get(encoding, wildcard), -index, encoding)
+        for index, encoding in enumerate(ENCODINGS)
+    ]
+    weight, _, encoding = max(candidates)
+    return encoding if weight > 0 else None
+
+
+class _Compressor:
+    """Потоковый компрессор выбранной кодировки"""
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            self._finish = self._compressor.flush
+        else:
+            # wbits=31: заголовок и контрольная сумма gzip
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+            self._finish = self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        """Сжатие фрагмента с выталкиванием, чтобы клиент получил его сразу"""
+        return self._compressor.compress(data) + self._compressor.flush(self._flush_mode)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжатие тела ответа целиком"""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def _is_compressible(headers: Headers) -> bool:
+    content_type = b""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value
+    return content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+
+
+def _without(headers: Headers, *names: bytes) -> Headers:
+    return [(name, value) for name, value in headers if name not in names]
+
+
+def _vary(headers: Headers) -> Headers:
+    """Заголовок Vary: Accept-Encoding (с сохранением других значений Vary)"""
+    values = [value for name, value in headers if name == b"vary"]
+    if any(b"accept-encoding" in value.lower() for value in values):
+        return headers
+    if values:
+        return _without(headers, b"vary") + [(b"vary", b", ".join(values + [b"Accept-Encoding"]))]
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+
+class CachedPage:
+    """Готовый ответ страницы: заголовки, тело и маршрут (для метрик)"""
+
+    __slots__ = ("headers", "body", "etag", "route")
+
+    def __init__(self, headers: Headers, body: bytes, route):
+        self.headers = headers
+        self.body = body
+        self.etag = dict(headers).get(b"etag")
+        self.route = route
+
+
+class PageCache:
+    """
+    Кэш готовых (сжатых) тел популярных страниц
+
+    Страница попадает в кэш, когда ее строку запроса запросили
+    PAGE_CACHE_MIN_REQUESTS раз. Поколение увеличивается при каждой записи:
+    ответ, начатый до записи, в кэш уже не попадет.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, min_requests: int):
+        self.pages = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.requests = LRUCache(maxsize=maxsize * 4, ttl=ttl)
+        self.min_requests = min_requests
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(scope, encoding: Optional[str]) -> str:
+        """Ключ страницы: путь, нормализованная строка запроса и кодировка"""
+        query = urlencode(sorted(parse_qsl(scope["query_string"].decode("latin-1"),
+                                           keep_blank_values=True)))
+        return f"{scope['path']}?{query}#{encoding or 'identity'}"
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        page = self.pages.get(key)
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def admit(self, key: str) -> bool:
+        """Учет запроса строки; True, когда ее страницу пора сохранить"""
+        seen = (self.requests.get(key) or 0) + 1
+        self.requests.set(key, seen)
+        return seen >= self.min_requests
+
+    def set(self, key: str, page: CachedPage, generation: int):
+        if generation != self.generation:
+            return
+        self.pages.set(key, page)
+        self.stores += 1
+
+    def invalidate(self):
+        self.generation += 1
+        self.invalidations += 1
+        self.pages.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PAGE_CACHE_ENABLED,
+            "size": len(self.pages),
+            "maxsize": self.pages.maxsize,
+            "ttl": self.pages.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "encodings": list(ENCODINGS),
+        }
+
+
+page_cache = PageCache(PAGE_CACHE_MAXSIZE, PAGE_CACHE_TTL, PAGE_CACHE_MIN_REQUESTS)
+
+
+class CompressionMiddleware:
+    """
+    Согласованное сжатие ответов и кэш страниц GET /books/
+
+    Ставится внутри CORSMiddleware, чтобы заголовки CORS добавлялись
+    и к ответам из кэша.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        encoding = None
+        if COMPRESSION_ENABLED:
+            encoding = negotiate_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+
+        method = scope["method"]
+        path = scope["path"]
+        cache_key = None
+        if (PAGE_CACHE_ENABLED and method == "GET" and path in PAGE_CACHE_PATHS
+                and not is_sticky(Request(scope))):
+            cache_key = page_cache.key(scope, encoding)
+            page = page_cache.get(cache_key)
+            if page is not None:
+                PAGE_CACHE_REQUESTS.inc("hit")
+                scope["route"] = page.route
+                await self._send_cached(page, request_headers, send)
+                return
+            PAGE_CACHE_REQUESTS.inc("miss")
+            if not page_cache.admit(cache_key):
+                cache_key = None
+        generation = page_cache.generation
+        invalidates = (method not in ("GET", "HEAD", "OPTIONS")
+                       and path.startswith(PAGE_CACHE_INVALIDATING_PREFIXES)
+                       and path not in PAGE_CACHE_READ_ONLY_PATHS)
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                if invalidates and message["status"] < 400:
+                    page_cache.invalidate()
+                # Начало ответа откладывается до первого фрагмента тела
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None and more_body:
+                # Потоковый ответ: сжимаем по мере отправки, без порога размера
+                headers = list(start.get("headers", []))
+                if encoding is None or not _is_compressible(headers):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                start["headers"] = _vary(_without(headers, b"content-length")) + [
+                    (b"content-encoding", encoding.encode())
+                ]
+                await send(start)
+
+            if compressor is not None:
+                data = compressor.compress(body)
+                if not more_body:
+                    data += compressor.finish()
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            # Ответ одним фрагментом
+            headers = list(start.get("headers", []))
+            if _is_compressible(headers):
+                headers = _vary(headers)
+                if encoding is not None and len(body) >= COMPRESSION_MIN_SIZE:
+                    body = compress(body, encoding)
+                    headers = _without(headers, b"content-length") + [
+                        (b"content-encoding", encoding.encode()),
+                        (b"content-length", str(len(body)).encode()),
+                    ]
+            start["headers"] = headers
+            if (cache_key is not None and start["status"] == 200
+                    and len(body) <= PAGE_CACHE_MAX_BODY
+                    and not scope.get("state", {}).get("db_replica")):
+                # Страница, прочитанная с реплики, может отставать — ее не кэшируем
+                cached = [(name, value) for name, value in headers if name in CACHED_HEADERS]
+                page_cache.set(cache_key, CachedPage(cached, body, scope.get("route")), generation)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _send_cached(page: CachedPage, request_headers: dict, send):
+        """Ответ из кэша, в том числе 304 по совпадающему If-None-Match"""
+        if_none_match = request_headers.get(b"if-none-match")
+        if if_none_match is not None and page.etag is not None and \
+                page.etag.removeprefix(b"W/") in (value.strip().removeprefix(b"W/")
+                                                  for value in if_none_match.split(b",")):
+            headers = [(name, value) for name, value in page.headers if name in (b"etag", b"vary")]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers = page.headers + [(b"content-length", str(len(page.body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": page.body})
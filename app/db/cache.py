@@ -0,0 +1,164 @@
+# app/db/cache.py
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+try:
+    from redis import asyncio as redis_asyncio
+except ImportError:  # redis — необязательная зависимость
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# Настройки кэша из переменных окружения
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+# Префикс ключей в общем хранилище
+REDIS_KEY_PREFIX = "bookstore:"
+
+
+class LRUCache:
+    """LRU-кэш в памяти процесса с ограничением по размеру и TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class EntityCache:
+    """
+    Кэш сущностей для чтения в обход БД.
+
+    Первый уровень — LRU в памяти процесса, второй (необязательный) — общий
+    Redis-совместимый сервер. Значения — обычные словари, а не ORM-объекты,
+    поэтому не привязаны к сессии. Ошибки общего хранилища не ломают запрос:
+    запись просто читается из БД.
+
+    Другие процессы узнают об изменении через общее хранилище, но их локальный
+    уровень может отдавать старое значение до истечения TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, redis_url: Optional[str] = None,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.shared = None
+        if redis_url:
+            if redis_asyncio is None:
+                logger.warning("CACHE_REDIS_URL задан, но пакет redis не установлен")
+            else:
+                self.shared = redis_asyncio.from_url(redis_url)
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        if self.shared is not None:
+            try:
+                raw = await self.shared.get(REDIS_KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning("Ошибка чтения из общего кэша: %s", e)
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                await self.shared.set(REDIS_KEY_PREFIX + key, json.dumps(value),
+                                      ex=max(int(self.ttl), 1))
+            except Exception as e:
+                logger.warning("Ошибка записи в общий кэш: %s", e)
+
+    async def invalidate(self, *keys: str):
+        self.invalidations += len(keys)
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None and keys:
+            try:
+                await self.shared.delete(*(REDIS_KEY_PREFIX + key for key in keys))
+            except Exception as e:
+                logger.warning("Ошибка инвалидации общего кэша: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "backend": "memory+redis" if self.shared is not None else "memory",
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "ttl": self.ttl,
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.local.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def book_key(book_id: int) -> str:
+    return f"book:{book_id}"
+
+
+def category_key(category_id: int) -> str:
+    return f"category:{category_id}"
+
+
+cache = EntityCache(
+    maxsize=CACHE_MAXSIZE,
+    ttl=CACHE_TTL,
+    redis_url=CACHE_REDIS_URL,
+    enabled=CACHE_ENABLED,
+)
@@ -1,123 +1,826 @@
 # app/db/crud.py
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, joinedload, undefer
+from sqlalchemy import (
+    Integer, and_, case, cast, delete, desc, exists, func, insert, literal, literal_column,
+    null, select, true, tuple_, union_all, update
+)
+import operator
+from bisect import bisect_right
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 from app.db import models
+from app.db.cache import book_key, cache, category_key
+from app.db.pagination import apply_keyset
+from app.db.search import apply_text_search, text_search_order
 from . import models
 
+# Ключи сортировки для keyset-пагинации (последняя колонка всегда уникальна)
+BOOK_SORT_KEYS = {
+    "id": ("id",),
+    "price": ("price", "id"),
+}
+CATEGORY_SORT_KEYS = {
+    "id": ("id",),
+}
+
+def _sort_columns(model, sort_keys: dict, sort: str) -> list:
+    """Колонки модели для выбранной сортировки"""
+    return [getattr(model, attr) for attr in sort_keys[sort]]
+
+# ========== Ограничения БД ==========
+
+class ConstraintViolation(ValueError):
+    """Запись нарушила ограничение БД"""
+
+class DuplicateTitle(ConstraintViolation):
+    """Запись с таким названием уже существует"""
+
+class MissingCategory(ConstraintViolation):
+    """Категория, на которую ссылается книга, не существует"""
+
+class BookNotFound(LookupError):
+    """Книги с таким ID нет (для пакетных операций)"""
+
+def _insert(db: AsyncSession, model):
+    """INSERT диалекта сессии (с поддержкой ON CONFLICT, где она есть)"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return insert(model)
+
+def _on_conflict_do_nothing(statement, *columns):
+    """ON CONFLICT (columns) DO NOTHING; без поддержки диалектом конфликт станет IntegrityError"""
+    if hasattr(statement, "on_conflict_do_nothing"):
+        return statement.on_conflict_do_nothing(index_elements=columns)
+    return statement
+
+def _violation(error: IntegrityError) -> ConstraintViolation:
+    """Тип нарушенного ограничения по ошибке драйвера"""
+    # asyncpg отдает SQLSTATE, SQLite — только текст ошибки
+    sqlstate = getattr(error.orig, "sqlstate", None)
+    message = str(error.orig).upper()
+    if sqlstate == "23503" or "FOREIGN KEY" in message:
+        return MissingCategory(str(error.orig))
+    if sqlstate == "23505" or "UNIQUE" in message:
+        return DuplicateTitle(str(error.orig))
+    raise error
+
+def _violation_detail(violation: ConstraintViolation) -> str:
+    """Причина отката пачки для отчета об импорте"""
+    if isinstance(violation, MissingCategory):
+        return "категорию книги пачки удалили во время импорта"
+    return "книгу пачки добавили конкурентно во время импорта"
+
 # ========== CRUD для категорий ==========
 
-def create_category(db: Session, title: str) -> models.Category:
-    """Создание новой категории"""
-    db_category = models.Category(title=title)
-    db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
-    return db_category
+def _books_count_subquery():
+    """Коррелированный подзапрос с количеством книг в категории"""
+    return (
+        select(func.count(models.Book.id))
+        .where(models.Book.category_id == models.Category.id)
+        .correlate(models.Category)
+        .scalar_subquery()
+        .label("books_count")
+    )
+
+def _returning_books_count():
+    """
+    Количество книг для RETURNING обновляемой категории
+
+    В RETURNING колонки выводятся без имени таблицы, и `id` внутри
+    подзапроса указал бы на books.id, поэтому ссылка квалифицирована явно.
+    """
+    return (
+        select(func.count(models.Book.id))
+        .where(models.Book.category_id == literal_column("categories.id"))
+        .scalar_subquery()
+        .label("books_count")
+    )
+
+def _with_books_count(rows) -> List[models.Category]:
+    """Перенос посчитанного количества книг в атрибут категории"""
+    categories = []
+    for category, books_count in rows:
+        category.books_count = books_count
+        categories.append(category)
+    return categories
 
-def get_categories(db: Session, skip: int = 0, limit: int = 100) -> List[models.Category]:
+async def create_category(db: AsyncSession, title: str) -> dict:
+    """
+    Создание новой категории одним INSERT ... ON CONFLICT DO NOTHING RETURNING
+
+    Возвращает словарь в формате схемы Category; DuplicateTitle, если
+    категория с таким названием уже есть.
+    """
+    result = await db.execute(
+        _on_conflict_do_nothing(
+            _insert(db, models.Category).values(title=title), models.Category.title
+        ).returning(models.Category.id, models.Category.title)
+    )
+    row = result.first()
+    if row is None:
+        await db.rollback()
+        raise DuplicateTitle(title)
+    await db.commit()
+    return dict(row._mapping)
+
+async def get_categories(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id"
+) -> List[models.Category]:
     """Получение списка категорий"""
-    return db.query(models.Category).offset(skip).limit(limit).all()
+    query = apply_keyset(
+        select(models.Category, _books_count_subquery()),
+        _sort_columns(models.Category, CATEGORY_SORT_KEYS, sort),
+        sort,
+        cursor
+    )
+    result = await db.execute(query.offset(skip).limit(limit))
+    return _with_books_count(result.all())
 
-def get_category_by_id(db: Session, category_id: int) -> Optional[models.Category]:
-    """Получение категории по ID"""
-    return db.query(models.Category).filter(models.Category.id == category_id).first()
+async def get_category_by_id(
+    db: AsyncSession,
+    category_id: int,
+    with_books_count: bool = False
+) -> Optional[models.Category]:
+    """Получение категории по ID (при необходимости вместе с количеством книг)"""
+    if not with_books_count:
+        return await db.scalar(
+            select(models.Category).where(models.Category.id == category_id)
+        )
 
-def update_category(db: Session, category_id: int, title: str) -> Optional[models.Category]:
-    """Обновление категории"""
-    db_category = get_category_by_id(db, category_id)
-    if db_category:
-        db_category.title = title
-        db.commit()
-        db.refresh(db_category)
-    return db_category
+    result = await db.execute(
+        select(models.Category, _books_count_subquery()).where(
+            models.Category.id == category_id
+        )
+    )
+    row = result.first()
+    if row is None:
+        return None
+    return _with_books_count([row])[0]
+
+async def _cache_fill(db: AsyncSession, key: str, value: dict):
+    """
+    Запись прочитанной из БД сущности в кэш
 
-def delete_category(db: Session, category_id: int) -> bool:
+    Сессии реплики кэш не заполняют: отстающая реплика вернула бы в кэш
+    версию, которую запись на основной БД только что сбросила.
+    """
+    if not db.info.get("replica"):
+        await cache.set(key, value)
+
+def _category_data(db_category: models.Category) -> dict:
+    """Снимок категории для кэша"""
+    return {
+        "id": db_category.id,
+        "title": db_category.title,
+        "updated_at": db_category.updated_at.isoformat(),
+    }
+
+async def get_category_cached(db: AsyncSession, category_id: int) -> Optional[dict]:
+    """Получение категории по ID через кэш (словарь с id и title)"""
+    data = await cache.get(category_key(category_id))
+    if data is None:
+        db_category = await get_category_by_id(db, category_id)
+        if db_category is None:
+            return None
+        data = _category_data(db_category)
+        await _cache_fill(db, category_key(category_id), data)
+    return data
+
+async def category_has_books(db: AsyncSession, category_id: int) -> bool:
+    """Проверка наличия книг в категории через EXISTS"""
+    return await db.scalar(
+        select(exists().where(models.Book.category_id == category_id))
+    )
+
+async def update_category(db: AsyncSession, category_id: int, title: str) -> Optional[dict]:
+    """
+    Обновление категории одним UPDATE ... RETURNING
+
+    Возвращает словарь в формате схемы Category вместе с количеством книг
+    или None, если категории нет; DuplicateTitle при занятом названии.
+    """
+    try:
+        result = await db.execute(
+            update(models.Category)
+            .where(models.Category.id == category_id)
+            .values(title=title)
+            .returning(models.Category.id, models.Category.title, _returning_books_count())
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _violation(e) from e
+    if row is not None:
+        await cache.invalidate(category_key(category_id))
+        return dict(row._mapping)
+    return None
+
+async def delete_category(db: AsyncSession, category_id: int) -> bool:
     """Удаление категории"""
-    db_category = get_category_by_id(db, category_id)
+    db_category = await get_category_by_id(db, category_id)
     if db_category:
-        db.delete(db_category)
-        db.commit()
+        await db.delete(db_category)
+        await db.commit()
+        await cache.invalidate(category_key(category_id))
         return True
     return False
 
+# ========== Статистика категорий ==========
+
+def _price_bucket_counts() -> list:
+    """Количество книг в каждой корзине гистограммы цен"""
+    bounds = (0,) + models.PRICE_HISTOGRAM_BOUNDS + (None,)
+    counts = []
+    for low, high in zip(bounds, bounds[1:]):
+        condition = models.Book.price >= low
+        if high is not None:
+            condition = and_(condition, models.Book.price < high)
+        counts.append(func.coalesce(func.sum(case((condition, 1), else_=0)), 0))
+    return counts
+
+async def refresh_category_stats(db: AsyncSession, category_ids: Optional[Iterable[int]] = None):
+    """
+    Пересчет сводки по категориям (None — по всем)
+
+    Выполняется одним INSERT ... SELECT ... ON CONFLICT DO UPDATE. Стоимость
+    пропорциональна числу книг категорий, поэтому пересчет нужен только после
+    записи книг в обход crud (генератор, начальные данные); записи через crud
+    обновляют сводку на дельту (update_category_stats).
+    """
+    if category_ids is not None:
+        category_ids = {category_id for category_id in category_ids if category_id is not None}
+        if not category_ids:
+            return
+
+    stats = models.CategoryStats
+    columns = [
+        stats.category_id, stats.books_count, stats.price_min, stats.price_max,
+        stats.price_sum, *models.PRICE_BUCKET_COLUMNS, stats.updated_at,
+    ]
+    query = (
+        select(
+            models.Category.id,
+            func.count(models.Book.id),
+            func.min(models.Book.price),
+            func.max(models.Book.price),
+            func.coalesce(func.sum(models.Book.price), 0),
+            *_price_bucket_counts(),
+            literal(models.utcnow(), stats.updated_at.type),
+        )
+        .select_from(models.Category)
+        .outerjoin(models.Book, models.Book.category_id == models.Category.id)
+        # WHERE обязателен: без него SQLite путает ON CONFLICT с условием JOIN
+        .where(true())
+        .group_by(models.Category.id)
+    )
+    if category_ids is not None:
+        query = query.where(models.Category.id.in_(list(category_ids)))
+
+    statement = _insert(db, stats).from_select([column.key for column in columns], query)
+    if hasattr(statement, "on_conflict_do_update"):
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[stats.category_id],
+            set_={column.key: statement.excluded[column.key] for column in columns[1:]}
+        ))
+    else:
+        affected = delete(stats)
+        if category_ids is not None:
+            affected = affected.where(stats.category_id.in_(list(category_ids)))
+        await db.execute(affected)
+        await db.execute(statement)
+
+def _lock_categories(category_ids: Iterable[int]):
+    """
+    Блокировка строк категорий в порядке ID (без взаимоблокировок между записями)
+
+    FOR NO KEY UPDATE не конфликтует с FOR KEY SHARE, которую берет внешний
+    ключ вставляемой книги, но сериализует изменения сводки одной категории.
+    """
+    return (
+        select(models.Category.id)
+        .where(models.Category.id.in_(sorted(category_ids)))
+        .order_by(models.Category.id)
+        .with_for_update(key_share=True)
+    )
+
+async def update_category_stats(db: AsyncSession, added: Iterable[Tuple[int, float]] = (),
+                                removed: Iterable[Tuple[int, float]] = ()):
+    """
+    Инкрементальное обновление сводки по изменениям книг
+
+    added и removed — пары (категория, цена) добавленных и удаленных книг;
+    изменение книги — удаление старой пары и добавление новой. Строки
+    категорий блокируются в порядке ID, затем счетчики, сумма и корзины
+    меняются на дельту одним INSERT ... ON CONFLICT DO UPDATE. Минимум и
+    максимум пересчитываются по книгам категории только тогда, когда
+    удаленная цена совпадает с текущей границей. Вызывается в транзакции
+    записи книг, до commit.
+    """
+    deltas: Dict[int, dict] = {}
+    removed_bounds: Dict[int, Tuple[float, float]] = {}
+    bucket_keys = [column.key for column in models.PRICE_BUCKET_COLUMNS]
+    for sign, changes in ((1, added), (-1, removed)):
+        for category_id, price in changes:
+            if category_id is None:
+                continue
+            delta = deltas.setdefault(category_id, {
+                "category_id": category_id, "books_count": 0, "price_sum": 0.0,
+                "price_min": None, "price_max": None, **dict.fromkeys(bucket_keys, 0),
+            })
+            delta["books_count"] += sign
+            delta["price_sum"] += sign * price
+            delta[bucket_keys[bisect_right(models.PRICE_HISTOGRAM_BOUNDS, price)]] += sign
+            if sign > 0:
+                delta["price_min"] = price if delta["price_min"] is None else min(delta["price_min"], price)
+                delta["price_max"] = price if delta["price_max"] is None else max(delta["price_max"], price)
+            else:
+                low, high = removed_bounds.get(category_id, (price, price))
+                removed_bounds[category_id] = (min(low, price), max(high, price))
+    if not deltas:
+        return
+
+    await db.execute(_lock_categories(deltas))
+    statement = _insert(db, models.CategoryStats)
+    if not hasattr(statement, "on_conflict_do_update"):
+        # Без ON CONFLICT DO UPDATE сводка затронутых категорий строится заново
+        await refresh_category_stats(db, deltas)
+        return
+
+    stats = models.CategoryStats
+    updated_at = models.utcnow()
+    statement = statement.values([{**delta, "updated_at": updated_at} for delta in deltas.values()])
+    excluded = statement.excluded
+    books_count = stats.books_count + excluded.books_count
+    # Категория конфликтующей строки сводки; ссылка текстом, потому что внутри
+    # ON CONFLICT DO UPDATE SQLAlchemy не коррелирует подзапрос и добавил бы
+    # category_stats в его FROM
+    target_category = literal_column(f"{stats.__tablename__}.{stats.category_id.key}")
+
+    def bound(column, aggregate, removed_index, beyond):
+        """Граница цены: пересчет, если удалена книга с границей, иначе — с учетом добавленных"""
+        removed_price = case(
+            {category_id: prices[removed_index] for category_id, prices in removed_bounds.items()},
+            value=stats.category_id,
+        ) if removed_bounds else null()
+        recomputed = (
+            select(aggregate(models.Book.price))
+            .where(models.Book.category_id == target_category)
+            .scalar_subquery()
+        )
+        return case(
+            (beyond(removed_price, column), recomputed),
+            (column.is_(None), excluded[column.key]),
+            (excluded[column.key].is_(None), column),
+            (beyond(excluded[column.key], column), excluded[column.key]),
+            else_=column,
+        )
+
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[stats.category_id],
+        set_={
+            "books_count": books_count,
+            # Без книг сумма обнуляется, чтобы не копить ошибку округления
+            "price_sum": case((books_count == 0, 0), else_=stats.price_sum + excluded.price_sum),
+            "price_min": bound(stats.price_min, func.min, 0, operator.le),
+            "price_max": bound(stats.price_max, func.max, 1, operator.ge),
+            **{key: getattr(stats, key) + excluded[key] for key in bucket_keys},
+            "updated_at": excluded.updated_at,
+        }
+    ))
+
+async def get_category_stats(db: AsyncSession, category_id: Optional[int] = None,
+                             skip: int = 0, limit: int = 100) -> list:
+    """
+    Сводка по категориям из category_stats
+
+    Категории без книг (или без строки сводки) возвращаются с нулями.
+    """
+    stats = models.CategoryStats
+    query = (
+        select(
+            models.Category.id.label("category_id"),
+            models.Category.title,
+            func.coalesce(stats.books_count, 0).label("books_count"),
+            stats.price_min,
+            stats.price_max,
+            stats.price_sum,
+            *(func.coalesce(column, 0).label(column.key) for column in models.PRICE_BUCKET_COLUMNS),
+            stats.updated_at,
+        )
+        .select_from(models.Category)
+        .outerjoin(stats, stats.category_id == models.Category.id)
+        .order_by(models.Category.id)
+    )
+    if category_id is not None:
+        query = query.where(models.Category.id == category_id)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return list(result)
+
 # ========== CRUD для книг ==========
 
-def create_book(
-    db: Session, 
-    title: str, 
-    description: str, 
-    price: float, 
+# Колонки книги, возвращаемые запросами записи (RETURNING)
+BOOK_RETURNING_COLUMNS = (
+    models.Book.id,
+    models.Book.title,
+    models.Book.description,
+    models.Book.price,
+    models.Book.url,
+    models.Book.category_id,
+)
+
+async def _with_category(db: AsyncSession, row) -> dict:
+    """Книга из RETURNING в формате get_book_cached (категория — через кэш)"""
+    data = dict(row._mapping)
+    data["category"] = await get_category_cached(db, data["category_id"])
+    return data
+
+async def create_book(
+    db: AsyncSession,
+    title: str,
+    description: str,
+    price: float,
     category_id: int,
     url: str = ""
-) -> models.Book:
-    """Создание новой книги"""
-    db_book = models.Book(
-        title=title,
-        description=description,
-        price=price,
-        category_id=category_id,
-        url=url
-    )
-    db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
-    return db_book
-
-def get_books(db: Session, skip: int = 0, limit: int = 100) -> List[models.Book]:
+) -> dict:
+    """
+    Создание новой книги одним INSERT ... ON CONFLICT DO NOTHING RETURNING
+
+    Проверки выполняет БД: уникальность названия в категории и внешний ключ
+    на категорию. Возвращает словарь в формате get_book_cached; DuplicateTitle
+    или MissingCategory при нарушении ограничений.
+    """
+    statement = _on_conflict_do_nothing(
+        _insert(db, models.Book).values(
+            title=title,
+            description=description,
+            price=price,
+            category_id=category_id,
+            url=url
+        ),
+        models.Book.category_id, models.Book.title
+    ).returning(*BOOK_RETURNING_COLUMNS)
+    try:
+        result = await db.execute(statement)
+        row = result.first()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _violation(e) from e
+    if row is None:
+        await db.rollback()
+        raise DuplicateTitle(title)
+    await update_category_stats(db, added=[(row.category_id, row.price)])
+    await db.commit()
+    return await _with_category(db, row)
+
+async def bulk_create_books(
+    db: AsyncSession,
+    rows: Sequence[Tuple[int, dict]]
+) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    Массовое создание книг одной пачкой
+
+    Категории и дубликаты проверяются двумя запросами на всю пачку, вставка
+    выполняется одним INSERT ... ON CONFLICT DO NOTHING RETURNING и одним
+    commit. Книги, которые успели добавить конкурентно, попадают в ошибки;
+    если конкурентно удалили категорию, пачка откатывается и все ее строки
+    попадают в ошибки. Возвращает количество вставленных книг и ошибки вида
+    (номер строки, описание).
+    """
+    errors = []
+    if not rows:
+        return 0, errors
+
+    category_ids = {values["category_id"] for _, values in rows}
+    existing_categories = set(await db.scalars(
+        select(models.Category.id).where(models.Category.id.in_(category_ids))
+    ))
+
+    pairs = {(values["category_id"], values["title"]) for _, values in rows}
+    result = await db.execute(
+        select(models.Book.category_id, models.Book.title).where(
+            tuple_(models.Book.category_id, models.Book.title).in_(list(pairs))
+        )
+    )
+    existing_pairs = set(result.tuples())
+
+    # Строка файла для каждой вставляемой пары (категория, название)
+    to_insert: Dict[Tuple[int, str], Tuple[int, dict]] = {}
+    for row_number, values in rows:
+        pair = (values["category_id"], values["title"])
+        if values["category_id"] not in existing_categories:
+            errors.append((row_number, f"Категория с ID {values['category_id']} не существует"))
+        elif pair in existing_pairs:
+            errors.append((row_number, f"Книга с названием '{values['title']}' уже существует в этой категории"))
+        else:
+            # Повторы внутри пачки отсекаются так же, как дубликаты в БД
+            existing_pairs.add(pair)
+            to_insert[pair] = (row_number, values)
+
+    if not to_insert:
+        return 0, errors
+
+    statement = _on_conflict_do_nothing(
+        _insert(db, models.Book), models.Book.category_id, models.Book.title
+    ).returning(models.Book.category_id, models.Book.title, models.Book.price)
+    try:
+        result = await db.execute(statement, [values for _, values in to_insert.values()])
+        rows_inserted = result.all()
+        inserted = {(row.category_id, row.title) for row in rows_inserted}
+        await update_category_stats(db, added=[(row.category_id, row.price) for row in rows_inserted])
+        await db.commit()
+    except IntegrityError as e:
+        # Категорию удалили после проверки: пачка откатывается целиком
+        await db.rollback()
+        detail = f"Пачка не записана: {_violation_detail(_violation(e))}"
+        errors.extend((row_number, detail) for row_number, _ in to_insert.values())
+        return 0, sorted(errors)
+
+    for pair, (row_number, values) in to_insert.items():
+        if pair not in inserted:
+            # Такую же книгу добавили конкурентно после проверки
+            errors.append((row_number, f"Книга с названием '{values['title']}' уже существует в этой категории"))
+    return len(inserted), sorted(errors)
+
+async def get_books(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id"
+) -> List[models.Book]:
     """Получение списка книг с информацией о категории"""
-    return db.query(models.Book).join(models.Category).offset(skip).limit(limit).all()
+    query = _books_page_query(db, skip=skip, limit=limit, cursor=cursor, sort=sort)
+    result = await db.scalars(query)
+    return list(result)
 
-def get_book_by_id(db: Session, book_id: int) -> Optional[models.Book]:
+async def get_book_by_id(db: AsyncSession, book_id: int) -> Optional[models.Book]:
     """Получение книги по ID"""
-    return db.query(models.Book).filter(models.Book.id == book_id).first()
+    return await db.scalar(
+        select(models.Book)
+        .options(joinedload(models.Book.category), undefer(models.Book.description))
+        .where(models.Book.id == book_id)
+    )
+
+# Поля книги, которые хранятся в кэше (категория кэшируется отдельно)
+BOOK_CACHE_FIELDS = ("id", "title", "description", "price", "url", "category_id")
+
+def _book_data(db_book: models.Book) -> dict:
+    """Снимок книги для кэша"""
+    data = {field: getattr(db_book, field) for field in BOOK_CACHE_FIELDS}
+    data["updated_at"] = db_book.updated_at.isoformat()
+    return data
+
+async def get_book_cached(db: AsyncSession, book_id: int) -> Optional[dict]:
+    """
+    Получение книги по ID через кэш
 
-def get_books_by_category(db: Session, category_id: int) -> List[models.Book]:
+    Возвращает словарь в формате схемы Book с вложенной категорией.
+    Книга и категория кэшируются раздельно, поэтому переименование
+    категории не требует сброса книг.
+    """
+    data = await cache.get(book_key(book_id))
+    if data is None:
+        db_book = await get_book_by_id(db, book_id)
+        if db_book is None:
+            return None
+        data = _book_data(db_book)
+        await _cache_fill(db, book_key(book_id), data)
+        if db_book.category is not None:
+            category = _category_data(db_book.category)
+            await _cache_fill(db, category_key(category["id"]), category)
+            return {**data, "category": category}
+
+    category = None
+    if data["category_id"] is not None:
+        category = await get_category_cached(db, data["category_id"])
+    return {**data, "category": category}
+
+async def get_books_by_category(db: AsyncSession, category_id: int) -> List[models.Book]:
     """Получение книг по категории"""
-    return db.query(models.Book).filter(models.Book.category_id == category_id).all()
-
-def update_book(
-    db: Session, 
-    book_id: int, 
-    title: str, 
-    description: str, 
-    price: float, 
+    result = await db.scalars(
+        select(models.Book)
+        .options(joinedload(models.Book.category), undefer(models.Book.description))
+        .where(models.Book.category_id == category_id)
+    )
+    return list(result)
+
+async def update_book(
+    db: AsyncSession,
+    book_id: int,
+    title: str,
+    description: str,
+    price: float,
     category_id: int,
     url: str = ""
-) -> Optional[models.Book]:
-    """Обновление книги"""
-    db_book = get_book_by_id(db, book_id)
-    if db_book:
-        db_book.title = title
-        db_book.description = description
-        db_book.price = price
-        db_book.category_id = category_id
-        db_book.url = url
-        db.commit()
-        db.refresh(db_book)
-    return db_book
-
-def delete_book(db: Session, book_id: int) -> bool:
-    """Удаление книги"""
-    db_book = get_book_by_id(db, book_id)
-    if db_book:
-        db.delete(db_book)
-        db.commit()
-        return True
-    return False
+) -> Optional[dict]:
+    """
+    Обновление книги одним UPDATE ... RETURNING
+
+    Прежние категория и цена читаются заранее (с блокировкой строки), чтобы
+    обновить сводку обеих категорий. Возвращает словарь в формате
+    get_book_cached или None, если книги нет; DuplicateTitle или
+    MissingCategory при нарушении ограничений.
+    """
+    previous = (await db.execute(
+        select(models.Book.category_id, models.Book.price)
+        .where(models.Book.id == book_id).with_for_update()
+    )).first()
+    if previous is None:
+        await db.rollback()
+        return None
+
+    try:
+        result = await db.execute(
+            update(models.Book)
+            .where(models.Book.id == book_id)
+            .values(
+                title=title,
+                description=description,
+                price=price,
+                category_id=category_id,
+                url=url
+            )
+            .returning(*BOOK_RETURNING_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one()
+        await update_category_stats(db, added=[(row.category_id, row.price)],
+                                    removed=[(previous.category_id, previous.price)])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _violation(e) from e
+    await cache.invalidate(book_key(book_id))
+    return await _with_category(db, row)
 
-def get_categories_with_books(db: Session, skip: int = 0, limit: int = 100):
+async def delete_book(db: AsyncSession, book_id: int) -> bool:
+    """Удаление книги одним DELETE ... RETURNING (False, если книги нет)"""
+    result = await db.execute(
+        delete(models.Book)
+        .where(models.Book.id == book_id)
+        .returning(models.Book.category_id, models.Book.price)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row is None:
+        await db.rollback()
+        return False
+    await update_category_stats(db, removed=[(row.category_id, row.price)])
+    await db.commit()
+    await cache.invalidate(book_key(book_id))
+    return True
+
+# ========== Пакетные операции с книгами ==========
+
+async def get_books_by_ids(db: AsyncSession, book_ids: Sequence[int]) -> Dict[int, object]:
+    """Книги по списку ID одним запросом IN (строки, как у get_books_rows)"""
+    result = await db.execute(
+        select(*book_row_columns())
+        .select_from(models.Book)
+        .join(models.Category)
+        .where(models.Book.id.in_(list(set(book_ids))))
+    )
+    return {row.id: row for row in result}
+
+# Колонки книги, которые меняет пакетное частичное обновление (вместе с id)
+BOOK_PATCH_FIELDS = ("id", "title", "description", "price", "url", "category_id")
+
+async def batch_update_books(db: AsyncSession, patches: Sequence[dict]) -> Dict[int, Exception]:
+    """
+    Частичное обновление многих книг в одной транзакции
+
+    patches — словари с `id` и изменяемыми полями. Существование книг
+    (с блокировкой их строк), категорий и уникальность названий проверяются
+    тремя запросами на всю пачку, затем корректные изменения применяются одним массовым UPDATE
+    по первичному ключу и одним обновлением сводки. Возвращает ошибки
+    по номеру элемента: BookNotFound, MissingCategory или DuplicateTitle.
+    """
+    errors: Dict[int, Exception] = {}
+    book_ids = {patch["id"] for patch in patches}
+    # Строки блокируются до commit: прочитанные категория и цена — база дельты
+    # сводки, конкурентные изменение или удаление книги ждут этой пачки.
+    # Порядок по ID исключает взаимоблокировку двух пачек
+    result = await db.execute(
+        select(*(getattr(models.Book, field) for field in BOOK_PATCH_FIELDS))
+        .where(models.Book.id.in_(list(book_ids)))
+        .order_by(models.Book.id)
+        .with_for_update()
+    )
+    rows = {row.id: row._asdict() for row in result}
+    current = {book_id: (row["category_id"], row["title"]) for book_id, row in rows.items()}
+
+    # Итоговая пара (категория, название) для книг, где она меняется
+    targets: Dict[int, Tuple[int, str]] = {}
+    seen: Set[int] = set()
+    for index, patch in enumerate(patches):
+        book_id = patch["id"]
+        if book_id not in current:
+            errors[index] = BookNotFound(f"Книга с ID {book_id} не найдена")
+        elif book_id in seen:
+            errors[index] = ConstraintViolation(f"Книга с ID {book_id} повторяется в запросе")
+        elif "category_id" in patch or "title" in patch:
+            category_id, title = current[book_id]
+            targets[index] = (patch.get("category_id", category_id), patch.get("title", title))
+        seen.add(book_id)
+
+    category_ids = {category_id for category_id, _ in targets.values()}
+    existing_categories = set(await db.scalars(
+        select(models.Category.id).where(models.Category.id.in_(list(category_ids)))
+    )) if category_ids else set()
+
+    taken: Dict[Tuple[int, str], int] = {}
+    if targets:
+        result = await db.execute(
+            select(models.Book.id, models.Book.category_id, models.Book.title).where(
+                tuple_(models.Book.category_id, models.Book.title).in_(list(set(targets.values())))
+            )
+        )
+        taken = {(row.category_id, row.title): row.id for row in result}
+
+    for index, pair in targets.items():
+        book_id = patches[index]["id"]
+        if pair[0] not in existing_categories:
+            errors[index] = MissingCategory(f"Категория с ID {pair[0]} не существует")
+        elif taken.get(pair, book_id) != book_id:
+            errors[index] = DuplicateTitle(
+                f"Книга с названием '{pair[1]}' уже существует в этой категории"
+            )
+        else:
+            # Две книги пачки не могут получить одно название в одной категории
+            taken[pair] = book_id
+
+    updated_at = models.utcnow()
+    # Непереданные поля берутся из текущих значений: у всех строк один набор
+    # колонок, и массовый UPDATE остается одним executemany, а не группой по форме
+    to_update = [
+        {**rows[patch["id"]], **patch, "updated_at": updated_at}
+        for index, patch in enumerate(patches)
+        if index not in errors and len(patch) > 1
+    ]
+    if to_update:
+        try:
+            await db.execute(update(models.Book), to_update)
+            # Сводку меняют только найденные и обновленные книги с новой ценой
+            # или категорией; база дельты — заблокированные строки
+            changes = [
+                ((new["category_id"], new["price"]), (old["category_id"], old["price"]))
+                for new, old in ((patch, rows[patch["id"]]) for patch in to_update)
+            ]
+            changes = [(added, removed) for added, removed in changes if added != removed]
+            await update_category_stats(
+                db,
+                added=[added for added, _ in changes],
+                removed=[removed for _, removed in changes],
+            )
+            await db.commit()
+        except IntegrityError as e:
+            # Конкурентная запись нарушила ограничение: пачка откатывается целиком
+            await db.rollback()
+            violation = _violation(e)
+            for index in range(len(patches)):
+                errors.setdefault(index, violation)
+            return errors
+        await cache.invalidate(*(book_key(patch["id"]) for patch in to_update))
+    else:
+        # Менять нечего: снимаем блокировки строк
+        await db.rollback()
+    return errors
+
+async def batch_delete_books(db: AsyncSession, book_ids: Sequence[int]) -> Set[int]:
+    """Удаление многих книг одним DELETE ... RETURNING, возвращает ID удаленных"""
+    result = await db.execute(
+        delete(models.Book)
+        .where(models.Book.id.in_(list(set(book_ids))))
+        .returning(models.Book.id, models.Book.category_id, models.Book.price)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    deleted = {row.id for row in rows}
+    await update_category_stats(db, removed=[(row.category_id, row.price) for row in rows])
+    await db.commit()
+    if deleted:
+        await cache.invalidate(*(book_key(book_id) for book_id in deleted))
+    return deleted
+
+async def get_categories_with_books(db: AsyncSession, skip: int = 0, limit: int = 100):
     """Получение категорий с книгами"""
-    return db.query(models.Category).offset(skip).limit(limit).all()
-
-def search_books(db: Session, title: Optional[str] = None, 
-                 category_id: Optional[int] = None,
-                 min_price: Optional[float] = None,
-                 max_price: Optional[float] = None,
-                 skip: int = 0, limit: int = 100):
-    """Поиск книг по различным критериям"""
-    query = db.query(models.Book).join(models.Category)
-    
+    result = await db.scalars(select(models.Category).offset(skip).limit(limit))
+    return list(result)
+
+def _filter_books(query, title: Optional[str], category_id: Optional[int],
+                  min_price: Optional[float], max_price: Optional[float]):
+    """Общие фильтры поиска книг"""
     if title:
         query = query.filter(models.Book.title.ilike(f"%{title}%"))
     if category_id:
@@ -126,5 +829,262 @@ def search_books(db: Session, title: Optional[str] = None,
         query = query.filter(models.Book.price >= min_price)
     if max_price is not None:
         query = query.filter(models.Book.price <= max_price)
-    
-    return query.offset(skip).limit(limit).all()
\ No newline at end of file
+    return query
+
+def _books_page_query(db: AsyncSession, title: Optional[str] = None,
+                      category_id: Optional[int] = None,
+                      min_price: Optional[float] = None,
+                      max_price: Optional[float] = None,
+                      skip: int = 0, limit: int = 100,
+                      cursor: Optional[str] = None, sort: str = "id",
+                      q: Optional[str] = None, columns: Optional[Sequence] = None,
+                      numbered: bool = False):
+    """
+    Запрос одной страницы книг с фильтрами, сортировкой и пагинацией
+
+    С columns запрос возвращает строки с этими колонками вместо ORM-объектов;
+    numbered добавляет к ним колонку position — номер строки в порядке сортировки.
+    """
+    if columns:
+        query = select(*columns).select_from(models.Book).join(models.Category)
+    else:
+        # Категория загружается тем же JOIN, без отдельного запроса на каждую книгу
+        query = select(models.Book).join(models.Category).options(
+            contains_eager(models.Book.category),
+            undefer(models.Book.description)
+        )
+    query = _filter_books(query, title, category_id, min_price, max_price)
+
+    if q:
+        query = apply_text_search(db, query, q)
+        order = text_search_order(db, q)
+    else:
+        order = _sort_columns(models.Book, BOOK_SORT_KEYS, sort)
+        query = apply_keyset(query, order, sort, cursor)
+    if columns and numbered:
+        query = query.add_columns(func.row_number().over(order_by=order).label("position"))
+    return query.offset(skip).limit(limit)
+
+async def search_books(db: AsyncSession, title: Optional[str] = None,
+                       category_id: Optional[int] = None,
+                       min_price: Optional[float] = None,
+                       max_price: Optional[float] = None,
+                       skip: int = 0, limit: int = 100,
+                       cursor: Optional[str] = None, sort: str = "id",
+                       q: Optional[str] = None):
+    """
+    Поиск книг по различным критериям
+
+    При заданном q книги ищутся по названию и описанию через полнотекстовый
+    индекс и сортируются по релевантности; курсор в этом режиме не используется.
+    """
+    query = _books_page_query(
+        db, title=title, category_id=category_id, min_price=min_price,
+        max_price=max_price, skip=skip, limit=limit, cursor=cursor, sort=sort, q=q
+    )
+    result = await db.scalars(query)
+    return list(result)
+
+# Колонки, которые нужны для каждого поля схемы Book
+BOOK_FIELD_COLUMNS = {
+    "title": (models.Book.title,),
+    "description": (models.Book.description,),
+    "price": (models.Book.price,),
+    "url": (models.Book.url,),
+    "category_id": (models.Book.category_id,),
+    "id": (models.Book.id,),
+    "category": (models.Book.category_id, models.Category.title.label("category_title")),
+}
+# Колонки, которые читаются всегда: ключи сортировки и отпечаток страницы
+BOOK_ROW_REQUIRED_COLUMNS = (
+    models.Book.id,
+    models.Book.price,
+    models.Book.updated_at,
+    models.Category.updated_at.label("category_updated_at"),
+)
+
+def book_row_columns(fields: Optional[Sequence[str]] = None) -> list:
+    """Колонки запроса для выбранных полей книги (None — все поля)"""
+    columns = {}
+    for field in fields or BOOK_FIELD_COLUMNS:
+        for column in BOOK_FIELD_COLUMNS[field]:
+            columns[column.key] = column
+    for column in BOOK_ROW_REQUIRED_COLUMNS:
+        columns.setdefault(column.key, column)
+    return list(columns.values())
+
+async def get_books_rows(db: AsyncSession, fields: Optional[Sequence[str]] = None,
+                         **filters) -> list:
+    """
+    Страница книг в виде строк без ORM-объектов
+
+    Принимает те же аргументы, что и search_books; fields ограничивает
+    читаемые колонки полями схемы Book. Строки не попадают в identity map
+    сессии, поэтому подходят для сериализации больших страниц.
+    """
+    query = _books_page_query(db, columns=book_row_columns(fields), **filters)
+    result = await db.execute(query)
+    return list(result)
+
+# Колонки версии строки страницы: из них строится отпечаток для ETag
+BOOK_PAGE_VERSION_COLUMNS = (
+    models.Book.id,
+    models.Book.updated_at,
+    models.Category.updated_at.label("category_updated_at"),
+)
+
+async def get_books_page_fingerprint(db: AsyncSession, **filters) -> tuple:
+    """
+    Отпечаток страницы книг без чтения самих строк
+
+    Та же страница, что вернут get_books и search_books, но только ID и
+    отметки изменения книг и категорий — без описаний и сериализации.
+    Принимает те же аргументы, что и search_books.
+    """
+    result = await db.execute(_books_page_query(db, columns=BOOK_PAGE_VERSION_COLUMNS, **filters))
+    return books_rows_fingerprint(result)
+
+def books_rows_fingerprint(rows: Iterable) -> tuple:
+    """
+    Отпечаток страницы: упорядоченные версии ее строк (ID и отметки изменения)
+
+    Совпадает с get_books_page_fingerprint для строк get_books_rows. Меняется
+    при любой замене, удалении или перестановке строк страницы, даже если
+    их количество и сумма ID остались прежними.
+    """
+    return tuple((row.id, row.updated_at, row.category_updated_at) for row in rows)
+
+# ========== Фасеты поиска книг ==========
+
+# Фасеты: количество найденных книг по категориям и по корзинам цен
+BOOK_FACETS = ("category", "price")
+
+def _price_bucket_index(price):
+    """Номер корзины PRICE_HISTOGRAM_BOUNDS для цены"""
+    bounds = models.PRICE_HISTOGRAM_BOUNDS
+    return case(
+        *((price < bound, index) for index, bound in enumerate(bounds)),
+        else_=len(bounds)
+    )
+
+async def search_books_with_facets(db: AsyncSession, facets: Sequence[str],
+                                   fields: Optional[Sequence[str]] = None,
+                                   title: Optional[str] = None,
+                                   category_id: Optional[int] = None,
+                                   min_price: Optional[float] = None,
+                                   max_price: Optional[float] = None,
+                                   skip: int = 0, limit: int = 100,
+                                   cursor: Optional[str] = None, sort: str = "id",
+                                   q: Optional[str] = None) -> Tuple[list, dict]:
+    """
+    Страница книг (как get_books_rows) и фасеты по всем найденным книгам
+
+    Фасеты считаются по тем же фильтрам без пагинации и курсора. Страница и
+    группировки по каждому фасету объединяются UNION ALL в один запрос
+    (GROUPING SETS нет в SQLite); порядок страницы сохраняет row_number().
+    Возвращает строки страницы и словарь фасетов: category — список
+    (ID, название, количество) по убыванию количества, price — количество
+    книг в каждой корзине PRICE_HISTOGRAM_BOUNDS.
+    """
+    page = _books_page_query(
+        db, title=title, category_id=category_id, min_price=min_price,
+        max_price=max_price, skip=skip, limit=limit, cursor=cursor, sort=sort, q=q,
+        columns=book_row_columns(fields), numbered=True
+    ).subquery("page")
+    book_columns = [column for column in page.c if column.key != "position"]
+
+    matched = _filter_books(
+        select(
+            models.Book.category_id,
+            models.Category.title.label("category_title"),
+            _price_bucket_index(models.Book.price).label("price_bucket"),
+        ).join(models.Category),
+        title, category_id, min_price, max_price
+    )
+    if q:
+        matched = apply_text_search(db, matched, q).order_by(None)
+    matched = matched.cte("matched")
+
+    def branch(section: int, position, key, label, count, books):
+        return select(
+            literal_column(str(section), Integer).label("section"),
+            position.label("position"),
+            key.label("facet_key"),
+            label.label("facet_title"),
+            count.label("facet_count"),
+            *books
+        )
+
+    empty_books = [cast(null(), column.type).label(column.key) for column in book_columns]
+    no_title = cast(null(), models.Category.title.type)
+    no_number = cast(null(), Integer)
+    branches = [branch(0, page.c.position, no_number, no_title, no_number, book_columns)]
+    if "category" in facets:
+        branches.append(branch(
+            1, no_number, matched.c.category_id, matched.c.category_title, func.count(),
+            empty_books
+        ).group_by(matched.c.category_id, matched.c.category_title))
+    if "price" in facets:
+        branches.append(branch(
+            2, no_number, matched.c.price_bucket, no_title, func.count(), empty_books
+        ).group_by(matched.c.price_bucket))
+
+    query = union_all(*branches)
+    columns = query.selected_columns
+    result = await db.execute(query.order_by(
+        columns.section, columns.position, columns.facet_count.desc(), columns.facet_title
+    ))
+
+    rows = []
+    categories = []
+    prices = [0] * (len(models.PRICE_HISTOGRAM_BOUNDS) + 1)
+    for row in result:
+        if row.section == 0:
+            rows.append(row)
+        elif row.section == 1:
+            categories.append((row.facet_key, row.facet_title, row.facet_count))
+        else:
+            prices[row.facet_key] = row.facet_count
+
+    found = {}
+    if "category" in facets:
+        found["category"] = categories
+    if "price" in facets:
+        found["price"] = prices
+    return rows, found
+
+# Колонки выгрузки каталога
+EXPORT_COLUMNS = ("id", "title", "description", "price", "url", "category_id", "category_title")
+
+async def iter_books_for_export(db: AsyncSession, title: Optional[str] = None,
+                                category_id: Optional[int] = None,
+                                min_price: Optional[float] = None,
+                                max_price: Optional[float] = None,
+                                q: Optional[str] = None,
+                                batch_size: int = 1000) -> AsyncIterator:
+    """
+    Потоковое чтение книг для выгрузки
+
+    Строки читаются серверным курсором (yield_per) пачками по batch_size,
+    поэтому выгрузка всего каталога занимает постоянный объем памяти.
+    Фильтры те же, что и в search_books.
+    """
+    query = select(
+        models.Book.id,
+        models.Book.title,
+        models.Book.description,
+        models.Book.price,
+        models.Book.url,
+        models.Book.category_id,
+        models.Category.title.label("category_title")
+    ).join(models.Category)
+    query = _filter_books(query, title, category_id, min_price, max_price)
+
+    if q:
+        query = apply_text_search(db, query, q)
+    else:
+        query = query.order_by(models.Book.id)
+
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for row in result:
+        yield row
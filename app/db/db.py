@@ -1,9 +1,13 @@
 # app/db/db.py
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 import os
 from dotenv import load_dotenv
 
+from app.db.pool import InstrumentedPool
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -14,22 +18,75 @@ DB_NAME = os.getenv("DB_NAME", "octagon_db")
 DB_USER = os.getenv("DB_USER", "octagon")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "12345")
 
-# Формируем строку подключения
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Формируем строку подключения (асинхронный драйвер asyncpg).
+# DATABASE_URL целиком переопределяет параметры выше, например
+# sqlite+aiosqlite:///./bookstore.db для локального запуска
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+
+# Реплика только для чтения (необязательна): GET-маршруты читают с нее,
+# запись всегда идет в основную БД
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+
+# Параметры пула соединений (у реплики свой пул с теми же параметрами)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Пересоздание соединений старше N секунд (-1 — не пересоздавать)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Проверка соединения перед выдачей (отсекает мертвые соединения после failover)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Сколько соединений открыть при старте воркера (не больше DB_POOL_SIZE)
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+def pool_options(url: str) -> dict:
+    """Параметры пула для create_async_engine"""
+    parsed = make_url(url)
+    # SQLite в памяти живет в единственном соединении, пул ему не нужен
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": InstrumentedPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def create_engine(url: str):
+    """Асинхронный движок SQLAlchemy с пулом соединений"""
+    created = create_async_engine(url, **pool_options(url))
+    # SQLite проверяет внешние ключи (и выполняет ON DELETE CASCADE),
+    # только если это включено для каждого соединения
+    if created.dialect.name == "sqlite":
+        event.listen(created.sync_engine, "connect", _enable_sqlite_foreign_keys)
+    return created
 
-# Создаем движок SQLAlchemy
+# Создаем асинхронный движок SQLAlchemy
 engine = create_engine(DATABASE_URL)
+replica_engine = create_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
 
-# Создаем фабрику сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Создаем фабрику асинхронных сессий.
+# expire_on_commit=False: после commit объекты остаются доступными
+# без неявных запросов, которые в асинхронном режиме запрещены
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+# Сессии реплики помечены в info: из них не заполняется кэш сущностей
+ReplicaSessionLocal = async_sessionmaker(
+    bind=replica_engine, autoflush=False, expire_on_commit=False, info={"replica": True}
+) if replica_engine is not None else None
 
 # Базовый класс для моделей
 Base = declarative_base()
 
 # Функция для получения сессии БД (для Dependency Injection в FastAPI)
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
\ No newline at end of file
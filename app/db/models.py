@@ -1,28 +1,119 @@
 # app/db/models.py
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+from sqlalchemy import (
+    Column, Integer, String, Float, ForeignKey, Text, Index, DDL, DateTime, UniqueConstraint, event
+)
+from sqlalchemy.orm import deferred, relationship
 from app.db.db import Base
 
+def utcnow() -> datetime:
+    """Текущее время в UTC для отметок изменения"""
+    return datetime.now(timezone.utc)
+
 class Category(Base):
     __tablename__ = "categories"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(100), nullable=False, unique=True)
+    # Время последнего изменения (для ETag / Last-Modified)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow)
     
     # Связь с книгами
-    books = relationship("Book", back_populates="category", cascade="all, delete-orphan")
+    # passive_deletes: каскад выполняет ON DELETE CASCADE в БД, без загрузки книг
+    books = relationship("Book", back_populates="category", cascade="all, delete-orphan",
+                         passive_deletes=True)
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # Индекс для keyset-пагинации с сортировкой по цене
+        Index("ix_books_price_id", "price", "id"),
+        # Название книги уникально в пределах категории (цель ON CONFLICT при вставке)
+        UniqueConstraint("category_id", "title", name="uq_books_category_id_title"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
-    description = Column(Text)
+    # Описание загружается только по запросу (undefer): спискам оно обычно не нужно.
+    # raiseload: случайное обращение к незагруженному описанию — ошибка, а не скрытый SELECT
+    description = deferred(Column(Text), raiseload=True)
     price = Column(Float, nullable=False)
     url = Column(String(500), default="")
+    # Время последнего изменения (для ETag / Last-Modified)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow)
     
     # Внешний ключ на категорию
-    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"))
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), index=True)
     
     # Связь с категорией
-    category = relationship("Category", back_populates="books")
\ No newline at end of file
+    category = relationship("Category", back_populates="books")
+
+# ========== Сводная статистика по категориям ==========
+
+# Границы корзин гистограммы цен: [0, 500), [500, 1000), ..., [5000, +inf)
+PRICE_HISTOGRAM_BOUNDS = (500, 1000, 2000, 5000)
+
+class CategoryStats(Base):
+    """
+    Сводка по книгам категории
+
+    Поддерживается функциями записи книг в crud (update_category_stats),
+    поэтому чтение статистики не зависит от числа книг.
+    """
+    __tablename__ = "category_stats"
+    
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    books_count = Column(Integer, nullable=False, default=0)
+    price_min = Column(Float)
+    price_max = Column(Float)
+    price_sum = Column(Float, nullable=False, default=0)
+    # Количество книг в корзинах гистограммы (по одной колонке на корзину PRICE_HISTOGRAM_BOUNDS)
+    price_bucket_0 = Column(Integer, nullable=False, default=0)
+    price_bucket_1 = Column(Integer, nullable=False, default=0)
+    price_bucket_2 = Column(Integer, nullable=False, default=0)
+    price_bucket_3 = Column(Integer, nullable=False, default=0)
+    price_bucket_4 = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+
+PRICE_BUCKET_COLUMNS = tuple(
+    getattr(CategoryStats, f"price_bucket_{index}")
+    for index in range(len(PRICE_HISTOGRAM_BOUNDS) + 1)
+)
+
+# ========== Индексы полнотекстового поиска ==========
+
+# Конфигурация полнотекстового поиска PostgreSQL (каталог в основном на русском)
+SEARCH_CONFIG = "russian"
+
+# Документ для поиска: выражение в запросах должно совпадать с индексом
+BOOK_SEARCH_DOCUMENT = "coalesce(books.title, '') || ' ' || coalesce(books.description, '')"
+BOOK_SEARCH_VECTOR = f"to_tsvector('{SEARCH_CONFIG}', {BOOK_SEARCH_DOCUMENT})"
+
+# PostgreSQL: GIN-индекс по tsvector и триграммный индекс по названию
+for statement in (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING gin (({BOOK_SEARCH_VECTOR}))",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)",
+):
+    event.listen(Book.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# SQLite: внешняя FTS5-таблица, синхронизируемая триггерами (для локальных тестов)
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    "title, description, content='books', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO books_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+):
+    event.listen(Book.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Book.__table__, "after_drop",
+             DDL("DROP TABLE IF EXISTS books_fts").execute_if(dialect="sqlite"))
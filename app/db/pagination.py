@@ -0,0 +1,57 @@
+# app/db/pagination.py
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось разобрать или он не подходит к сортировке"""
+
+
+def encode_cursor(sort: str, key: Sequence[Any]) -> str:
+    """Кодирование ключа последней записи страницы в непрозрачный курсор"""
+    payload = json.dumps({"s": sort, "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, ...]:
+    """Декодирование курсора обратно в ключ сортировки"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = tuple(payload["k"])
+        cursor_sort = payload["s"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Некорректный курсор") from e
+
+    if cursor_sort != sort:
+        raise InvalidCursor("Курсор получен для другой сортировки")
+    return key
+
+
+def apply_keyset(query, columns: Sequence, sort: str, cursor: Optional[str]):
+    """
+    Сортировка запроса по ключу и продолжение с позиции курсора.
+
+    Условие `(col1, col2) > (:v1, :v2)` опирается на индекс по тем же
+    колонкам, поэтому любая страница стоит одинаково независимо от глубины.
+    """
+    if cursor is not None:
+        key = decode_cursor(cursor, sort)
+        if len(key) != len(columns):
+            raise InvalidCursor("Курсор не соответствует ключу сортировки")
+        if len(columns) == 1:
+            query = query.filter(columns[0] > key[0])
+        else:
+            query = query.filter(tuple_(*columns) > tuple_(*key))
+    return query.order_by(*columns)
+
+
+def next_cursor(items: List[Any], attrs: Sequence[str], sort: str, limit: int) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница последняя"""
+    if limit <= 0 or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(sort, [getattr(last, attr) for attr in attrs])
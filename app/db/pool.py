@@ -0,0 +1,89 @@
+# app/db/pool.py
+import asyncio
+import time
+from typing import Any, Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    """Счетчики выдачи соединений из пула"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений с замером времени ожидания при выдаче соединения.
+
+    Время включает ожидание свободного соединения, открытие нового
+    соединения сверх pool_size и pre-ping.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - started)
+
+
+def pool_status(pool) -> Dict[str, Any]:
+    """Текущее состояние пула для диагностики"""
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update({
+            "checkouts": stats.checkouts,
+            "checkout_timeouts": stats.timeouts,
+            "checkout_wait_total_ms": round(stats.wait_total * 1000, 3),
+            "checkout_wait_avg_ms": round(stats.wait_total / stats.checkouts * 1000, 3)
+            if stats.checkouts else 0.0,
+            "checkout_wait_max_ms": round(stats.wait_max * 1000, 3),
+        })
+    return status
+
+
+async def warm_up_pool(engine, connections: int) -> int:
+    """
+    Предварительное открытие соединений пула
+
+    Соединения открываются одновременно и сразу возвращаются в пул, чтобы
+    первые запросы нового воркера не платили за установку соединений.
+    Возвращает количество открытых соединений (не больше pool_size).
+    """
+    pool = engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return 0
+    connections = min(connections, pool.size())
+    if connections <= 0:
+        return 0
+    opened = await asyncio.gather(*(engine.connect().start() for _ in range(connections)))
+    await asyncio.gather(*(conn.close() for conn in opened))
+    return len(opened)
@@ -0,0 +1,170 @@
+# app/db/replica.py
+"""
+Маршрутизация чтения на реплику
+
+GET-маршруты получают сессию через get_read_db: при заданном
+DATABASE_REPLICA_URL она открывается на реплике, иначе на основной БД.
+Основная БД используется и для чтения, если:
+
+- клиент недавно что-то записал (read-your-writes): после успешного
+  изменяющего запроса ReadYourWritesMiddleware ставит cookie, и следующие
+  DB_REPLICA_STICKINESS секунд клиент читает с основной БД, не замечая
+  отставания реплики;
+- реплика недоступна: после ошибки соединения она пропускается
+  DB_REPLICA_RETRY_INTERVAL секунд.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import exc
+
+from app.db.db import ReplicaSessionLocal, SessionLocal, replica_engine
+from app.db.pool import pool_status
+from app.metrics import DB_READ_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд после записи клиент читает с основной БД
+REPLICA_STICKINESS = float(os.getenv("DB_REPLICA_STICKINESS", "5"))
+# Предел ожидания соединения с репликой, секунды
+REPLICA_CONNECT_TIMEOUT = float(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "1"))
+# Сколько секунд не обращаться к реплике после ошибки соединения
+REPLICA_RETRY_INTERVAL = float(os.getenv("DB_REPLICA_RETRY_INTERVAL", "10"))
+
+# Cookie со временем (Unix), до которого клиент читает с основной БД
+STICKY_COOKIE = "db_primary_until"
+
+# Методы, которые не изменяют данные
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Ошибки, после которых реплика считается недоступной
+REPLICA_ERRORS = (exc.DBAPIError, exc.TimeoutError, OSError, asyncio.TimeoutError)
+
+
+class ReplicaState:
+    """Доступность реплики в этом процессе"""
+
+    def __init__(self):
+        self.down_until = 0.0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def is_down(self) -> bool:
+        return time.monotonic() < self.down_until
+
+    def mark_down(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error) or type(error).__name__
+        self.down_until = time.monotonic() + REPLICA_RETRY_INTERVAL
+
+
+replica_state = ReplicaState()
+
+
+def is_sticky(request: Request) -> bool:
+    """Клиент недавно писал и должен читать с основной БД"""
+    value = request.cookies.get(STICKY_COOKIE)
+    if not value:
+        return False
+    try:
+        return float(value) > time.time()
+    except ValueError:
+        return False
+
+
+def _primary_reason(request: Request) -> Optional[str]:
+    """Причина читать с основной БД или None, если можно читать с реплики"""
+    if ReplicaSessionLocal is None:
+        return "no_replica"
+    if is_sticky(request):
+        return "sticky"
+    if replica_state.is_down():
+        return "replica_down"
+    return None
+
+
+@asynccontextmanager
+async def read_session(request: Request):
+    """
+    Сессия только для чтения: на реплике или на основной БД
+
+    Соединение с репликой открывается сразу, чтобы при ее недоступности
+    запрос прозрачно ушел на основную БД, а не завершился ошибкой.
+    """
+    reason = _primary_reason(request)
+    db = None
+    if reason is None:
+        db = ReplicaSessionLocal()
+        try:
+            await asyncio.wait_for(db.connection(), REPLICA_CONNECT_TIMEOUT)
+        except REPLICA_ERRORS as e:
+            await db.close()
+            db = None
+            reason = "replica_error"
+            replica_state.mark_down(e)
+            logger.warning("Реплика недоступна, чтение с основной БД: %s", e)
+    if db is None:
+        db = SessionLocal()
+
+    if ReplicaSessionLocal is not None:
+        DB_READ_SESSIONS.inc("primary" if reason else "replica", reason or "")
+    # Ответ, прочитанный с реплики, не попадает в кэш страниц (app.compression)
+    request.state.db_replica = reason is None
+    async with db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    """Сессия для GET-маршрутов (Dependency Injection в FastAPI)"""
+    async with read_session(request) as db:
+        yield db
+
+
+def replica_status() -> Dict[str, Any]:
+    """Состояние реплики для диагностики"""
+    if replica_engine is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "available": not replica_state.is_down(),
+        "retry_in_seconds": round(max(replica_state.down_until - time.monotonic(), 0.0), 3),
+        "failures": replica_state.failures,
+        "last_error": replica_state.last_error,
+        "stickiness_seconds": REPLICA_STICKINESS,
+        "pool": pool_status(replica_engine.pool),
+    }
+
+
+class ReadYourWritesMiddleware:
+    """
+    Cookie STICKY_COOKIE в ответах на успешные изменяющие запросы
+
+    Время хранится в самой cookie, поэтому привязка к основной БД
+    работает при любом числе воркеров и процессов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + REPLICA_STICKINESS
+                cookie = (f"{STICKY_COOKIE}={until:.3f}; Max-Age={math.ceil(REPLICA_STICKINESS)}; "
+                          f"Path=/; HttpOnly; SameSite=Lax")
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode("latin-1"))
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,98 @@
+# app/db/search.py
+import re
+from sqlalchemy import func, literal, literal_column, or_, table, column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import models
+
+# Токены запроса для FTS5 (буквы, цифры и подчеркивание)
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_books_fts = table("books_fts", column("rowid"), column("rank"))
+
+
+def _postgresql_search(query, q: str):
+    """
+    Поиск по tsvector с ранжированием и триграммным сходством названия.
+
+    Совпадение по tsvector использует GIN-индекс ix_books_search_vector,
+    опечатки в названии ловит оператор `q <% title` по индексу ix_books_title_trgm:
+    сходство строки запроса со словами названия, а не со всем названием,
+    поэтому короткий запрос находит длинное название.
+    """
+    vector, ts_query = _postgresql_query(q)
+    return query.filter(
+        or_(vector.op("@@")(ts_query), literal(q).op("<%")(models.Book.title))
+    ).order_by(*_postgresql_order(q))
+
+
+def _postgresql_query(q: str):
+    """tsvector книги и tsquery строки поиска"""
+    vector = literal_column(models.BOOK_SEARCH_VECTOR)
+    ts_query = func.websearch_to_tsquery(
+        literal_column(f"'{models.SEARCH_CONFIG}'"), q
+    )
+    return vector, ts_query
+
+
+def _postgresql_order(q: str) -> list:
+    """Ранг: лучшее из ts_rank_cd и word_similarity запроса к названию"""
+    vector, ts_query = _postgresql_query(q)
+    rank = func.greatest(
+        func.ts_rank_cd(vector, ts_query),
+        func.word_similarity(q, models.Book.title)
+    )
+    return [rank.desc(), models.Book.id]
+
+
+def _sqlite_search(query, q: str):
+    """Поиск через FTS5 по префиксам слов с ранжированием bm25"""
+    tokens = _TOKEN_RE.findall(q)
+    if not tokens:
+        return query.filter(False)
+    match = " ".join(f'"{token}"*' for token in tokens)
+    return query.join(
+        _books_fts, _books_fts.c.rowid == models.Book.id
+    ).filter(
+        literal_column("books_fts").op("MATCH")(match)
+    ).order_by(*_sqlite_order(q))
+
+
+def _sqlite_order(q: str) -> list:
+    """Ранг bm25 из FTS5 (без токенов поиск пуст, FTS-таблица не подключается)"""
+    if not _TOKEN_RE.search(q):
+        return [models.Book.id]
+    return [_books_fts.c.rank, models.Book.id]
+
+
+def _fallback_search(query, q: str):
+    """Поиск подстрокой для СУБД без полнотекстовых индексов"""
+    pattern = f"%{q}%"
+    return query.filter(
+        or_(models.Book.title.ilike(pattern), models.Book.description.ilike(pattern))
+    ).order_by(models.Book.id)
+
+
+def apply_text_search(db: AsyncSession, query, q: str):
+    """Фильтрация и сортировка запроса книг по релевантности к строке q"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return _postgresql_search(query, q)
+    if dialect == "sqlite":
+        return _sqlite_search(query, q)
+    return _fallback_search(query, q)
+
+
+def text_search_order(db: AsyncSession, q: str) -> list:
+    """
+    Порядок по релевантности, который задает apply_text_search
+
+    Нужен, когда тот же порядок используется вне ORDER BY запроса,
+    например в row_number() OVER (ORDER BY ...).
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return _postgresql_order(q)
+    if dialect == "sqlite":
+        return _sqlite_order(q)
+    return [models.Book.id]
@@ -0,0 +1,249 @@
+# app/generate_data.py
+"""
+Генератор синтетического каталога книг
+
+Пишет категории и книги пачками: в PostgreSQL через COPY (asyncpg),
+в остальных СУБД через executemany. Данные детерминированы: одно и то же
+зерно дает один и тот же каталог, поэтому прогоны бенчмарков сравнимы.
+
+Примеры:
+    python app/generate_data.py --categories 100 --books-per-category 10000
+    python app/generate_data.py --database-url sqlite+aiosqlite:///./bench.db --drop \\
+        --categories 50 --books-per-category 2000 --description-dist lognormal --seed 7
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Iterator, List, Tuple
+
+# Добавляем корень проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Предел длины описания из схемы BookBase
+DESCRIPTION_MAX_LENGTH = 2000
+
+BOOK_COLUMNS = ("title", "description", "price", "url", "category_id", "updated_at")
+
+TOPICS = (
+    "Программирование", "Научная фантастика", "Бизнес и экономика", "История",
+    "Психология", "Математика", "Детективы", "Классика", "Путешествия", "Искусство",
+)
+ADJECTIVES = (
+    "Полное", "Краткое", "Практическое", "Современное", "Забытое", "Новое",
+    "Большое", "Тайное", "Простое", "Главное", "Второе", "Последнее",
+)
+NOUNS = (
+    "руководство", "введение", "путешествие", "искусство", "наследие", "правило",
+    "открытие", "искушение", "решение", "пособие", "начало", "возвращение",
+)
+WORDS = (
+    "книга история программирование данные python алгоритм роман фантастика "
+    "экономика бизнес наука космос путешествие код архитектура система сеть "
+    "база запрос индекс производительность дюна основание классика руководство "
+    "автор герой время город мир война любовь жизнь человек дорога тайна"
+).split()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Генерация синтетического каталога книг")
+    parser.add_argument("--database-url", help="URL БД (по умолчанию DATABASE_URL / DB_*)")
+    parser.add_argument("--categories", type=int, default=10, help="Количество категорий")
+    parser.add_argument("--books-per-category", type=int, default=1000,
+                        help="Количество книг в каждой категории")
+    parser.add_argument("--description-dist", choices=("fixed", "uniform", "normal", "lognormal"),
+                        default="lognormal", help="Распределение длины описания")
+    parser.add_argument("--description-mean", type=int, default=300,
+                        help="Средняя длина описания в символах")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Размер пачки записи")
+    parser.add_argument("--drop", action="store_true", help="Пересоздать таблицы перед генерацией")
+    parser.add_argument("--method", choices=("auto", "copy", "insert"), default="auto",
+                        help="Способ записи: COPY (только PostgreSQL) или executemany")
+    return parser.parse_args(argv)
+
+
+# ========== Генерация строк ==========
+
+def description_length(rng: random.Random, dist: str, mean: int) -> int:
+    """Длина описания по выбранному распределению"""
+    if dist == "fixed":
+        length = mean
+    elif dist == "uniform":
+        length = rng.randint(0, 2 * mean)
+    elif dist == "normal":
+        length = int(rng.gauss(mean, mean / 3))
+    else:
+        # Логнормальное: много коротких описаний и длинный хвост
+        length = int(rng.lognormvariate(0, 0.75) * mean / 1.32)
+    return max(0, min(length, DESCRIPTION_MAX_LENGTH))
+
+
+def make_description(rng: random.Random, length: int) -> str:
+    """Текст из словаря заданной длины"""
+    if length == 0:
+        return ""
+    # Средняя длина слова с пробелом около 8 символов
+    text = " ".join(rng.choices(WORDS, k=length // 8 + 1))
+    return text[:length]
+
+
+def category_titles(count: int) -> List[str]:
+    """Уникальные названия категорий"""
+    return [
+        TOPICS[i % len(TOPICS)] + ("" if i < len(TOPICS) else f" {i // len(TOPICS) + 1}")
+        for i in range(count)
+    ]
+
+
+def iter_books(category_ids: List[int], books_per_category: int, seed: int,
+               dist: str, mean: int, timestamp) -> Iterator[Tuple]:
+    """
+    Книги каталога в порядке категорий
+
+    У каждой категории свой генератор, зависящий только от зерна и номера
+    категории, поэтому результат не зависит от размера пачки.
+    """
+    for index, category_id in enumerate(category_ids):
+        rng = random.Random(f"{seed}:{index}")
+        for number in range(1, books_per_category + 1):
+            # Номер делает название уникальным в пределах категории
+            title = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}, том {number}"
+            yield (
+                title,
+                make_description(rng, description_length(rng, dist, mean)),
+                round(rng.uniform(100, 5000), 2),
+                f"https://example.com/books/{index + 1}-{number}",
+                category_id,
+                timestamp,
+            )
+
+
+def batched(rows: Iterator[Tuple], size: int) -> Iterator[List[Tuple]]:
+    """Разбиение потока строк на пачки"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ========== Запись в БД ==========
+
+async def _copy_books(conn, batch: List[Tuple]):
+    """Запись пачки через COPY (asyncpg)"""
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "books", records=batch, columns=list(BOOK_COLUMNS)
+    )
+
+
+async def _insert_books(conn, batch: List[Tuple]):
+    """Запись пачки через executemany"""
+    from sqlalchemy import insert
+    from app.db import models
+
+    await conn.execute(insert(models.Book), [dict(zip(BOOK_COLUMNS, row)) for row in batch])
+
+
+async def generate_catalog(engine, categories: int, books_per_category: int, seed: int = 42,
+                           description_dist: str = "lognormal", description_mean: int = 300,
+                           batch_size: int = 10_000, drop: bool = False,
+                           method: str = "auto") -> int:
+    """
+    Генерация каталога, возвращает количество записанных книг
+
+    Без drop в БД не должно быть категорий каталога, иначе ValueError.
+    """
+    from sqlalchemy import func, insert, select
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.db import crud, models
+    from app.db.db import Base
+
+    if method == "auto":
+        method = "copy" if engine.dialect.name == "postgresql" else "insert"
+    if method == "copy" and engine.dialect.name != "postgresql":
+        raise ValueError("COPY поддерживается только для PostgreSQL")
+    write_batch = _copy_books if method == "copy" else _insert_books
+
+    async with engine.begin() as conn:
+        if drop:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+        titles = category_titles(categories)
+        existing = await conn.scalar(
+            select(func.count()).select_from(models.Category)
+            .where(models.Category.title.in_(titles))
+        )
+        if existing:
+            # Повторная генерация дала бы те же названия категорий и книг
+            raise ValueError(
+                f"В БД уже есть категории каталога ({existing} шт.). "
+                "Запустите генерацию с --drop, чтобы пересоздать таблицы"
+            )
+
+        result = await conn.execute(
+            insert(models.Category).returning(models.Category.id),
+            [{"title": title} for title in titles]
+        )
+        category_ids = sorted(result.scalars())
+
+    timestamp = models.utcnow()
+    written = 0
+    rows = iter_books(category_ids, books_per_category, seed,
+                      description_dist, description_mean, timestamp)
+    # Каждая пачка фиксируется отдельно, чтобы не держать огромную транзакцию
+    for batch in batched(rows, batch_size):
+        async with engine.begin() as conn:
+            await write_batch(conn, batch)
+        written += len(batch)
+
+    # Книги записаны в обход crud, поэтому сводка категорий строится один раз в конце
+    async with AsyncSession(engine) as db:
+        await crud.refresh_category_stats(db)
+        await db.commit()
+    return written
+
+
+async def main(args: argparse.Namespace) -> int:
+    from app.db.db import engine
+
+    try:
+        total = args.categories * args.books_per_category
+        print(f"Генерация: {args.categories} категорий, {total} книг (зерно {args.seed})...")
+        started = time.perf_counter()
+        written = await generate_catalog(
+            engine,
+            categories=args.categories,
+            books_per_category=args.books_per_category,
+            seed=args.seed,
+            description_dist=args.description_dist,
+            description_mean=args.description_mean,
+            batch_size=args.batch_size,
+            drop=args.drop,
+            method=args.method,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    else:
+        elapsed = time.perf_counter() - started
+        print(f"✅ Записано книг: {written} за {elapsed:.1f} с "
+              f"({written / elapsed * 60:,.0f} строк в минуту)")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    # Настройки читаются при импорте app.db.db, поэтому задаются до него
+    if arguments.database_url:
+        os.environ["DATABASE_URL"] = arguments.database_url
+    sys.exit(asyncio.run(main(arguments)))
@@ -1,128 +1,105 @@
 # app/init_db.py
+"""
+Инициализация базы данных демонстрационным каталогом
+
+Для больших объемов (staging, профилирование) используйте app/generate_data.py.
+"""
+import asyncio
 import sys
 import os
 
 # Добавляем корень проекта в sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.db.db import engine, Base
-from app.db.crud import create_category, create_book
-from app.db.db import SessionLocal
+from sqlalchemy import insert, select
+
+from app.db.db import SessionLocal, engine, Base
+from app.db import crud, models
+
+# Демонстрационные данные: категория -> книги (название, описание, цена, url)
+SAMPLE_CATALOG = {
+    "Программирование": [
+        ("Чистый код: создание, анализ и рефакторинг",
+         "Руководство по написанию чистого кода от Роберта Мартина",
+         2500.00, "https://example.com/clean-code"),
+        ("Совершенный код",
+         "Полное руководство по разработке программного обеспечения",
+         2200.00, "https://example.com/code-complete"),
+        ("Python. Карманный справочник",
+         "Быстрый справочник по языку Python",
+         800.00, "https://example.com/python-pocket"),
+    ],
+    "Научная фантастика": [
+        ("Дюна",
+         "Эпическая научно-фантастическая сага Фрэнка Герберта",
+         1500.00, "https://example.com/dune"),
+        ("Основание",
+         "Классика научной фантастики Айзека Азимова",
+         1200.00, "https://example.com/foundation"),
+    ],
+    "Бизнес и экономика": [
+        ("Богатый папа, бедный папа",
+         "Руководство по финансовой грамотности",
+         900.00, "https://example.com/rich-dad"),
+        ("Самый богатый человек в Вавилоне",
+         "Классика финансовой литературы",
+         750.00, "https://example.com/babylon"),
+        ("7 навыков высокоэффективных людей",
+         "Книга о личной и профессиональной эффективности",
+         1300.00, "https://example.com/7-habits"),
+    ],
+}
+
 
-def init_database():
+async def refresh_stats():
+    """Пересчет сводки по всем категориям (книги добавлены в обход crud)"""
+    print("Пересчет статистики категорий...")
+    async with SessionLocal() as db:
+        await crud.refresh_category_stats(db)
+        await db.commit()
+
+
+async def init_database():
     """Инициализация базы данных"""
     print("Создание таблиц в базе данных...")
-    
-    # Создаем все таблицы
-    Base.metadata.create_all(bind=engine)
-    
-    # Создаем сессию
-    db = SessionLocal()
-    
+
     try:
-        # Проверяем, есть ли уже категории
-        from app.db.crud import get_categories
-        existing_categories = get_categories(db)
-        
-        if existing_categories:
+        # Таблицы и данные создаются в одной транзакции, книги — одним executemany
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+            existing = await conn.scalar(select(models.Category.id).limit(1))
+            if existing is None:
+                print("Добавление тестовых данных...")
+                result = await conn.execute(
+                    insert(models.Category).returning(models.Category.id, models.Category.title),
+                    [{"title": title} for title in SAMPLE_CATALOG]
+                )
+                category_ids = {title: category_id for category_id, title in result}
+
+                books = [
+                    {"title": title, "description": description, "price": price,
+                     "url": url, "category_id": category_ids[category]}
+                    for category, rows in SAMPLE_CATALOG.items()
+                    for title, description, price, url in rows
+                ]
+                await conn.execute(insert(models.Book), books)
+
+        # Сводка пересчитывается и для уже заполненной БД (например, после обновления схемы)
+        await refresh_stats()
+
+        if existing is not None:
             print("База данных уже инициализирована!")
             return
-        
-        print("Добавление тестовых данных...")
-        
-        # Создаем категории
-        print("Создание категорий...")
-        category1 = create_category(db, "Программирование")
-        category2 = create_category(db, "Научная фантастика")
-        category3 = create_category(db, "Бизнес и экономика")
-        
-        # Создаем книги для категории "Программирование"
-        print("Добавление книг по программированию...")
-        create_book(
-            db,
-            title="Чистый код: создание, анализ и рефакторинг",
-            description="Руководство по написанию чистого кода от Роберта Мартина",
-            price=2500.00,
-            category_id=category1.id,
-            url="https://example.com/clean-code"
-        )
-        
-        create_book(
-            db,
-            title="Совершенный код",
-            description="Полное руководство по разработке программного обеспечения",
-            price=2200.00,
-            category_id=category1.id,
-            url="https://example.com/code-complete"
-        )
-        
-        create_book(
-            db,
-            title="Python. Карманный справочник",
-            description="Быстрый справочник по языку Python",
-            price=800.00,
-            category_id=category1.id,
-            url="https://example.com/python-pocket"
-        )
-        
-        # Создаем книги для категории "Научная фантастика"
-        print("Добавление научно-фантастических книг...")
-        create_book(
-            db,
-            title="Дюна",
-            description="Эпическая научно-фантастическая сага Фрэнка Герберта",
-            price=1500.00,
-            category_id=category2.id,
-            url="https://example.com/dune"
-        )
-        
-        create_book(
-            db,
-            title="Основание",
-            description="Классика научной фантастики Айзека Азимова",
-            price=1200.00,
-            category_id=category2.id,
-            url="https://example.com/foundation"
-        )
-        
-        # Создаем книги для категории "Бизнес и экономика"
-        print("Добавление бизнес-литературы...")
-        create_book(
-            db,
-            title="Богатый папа, бедный папа",
-            description="Руководство по финансовой грамотности",
-            price=900.00,
-            category_id=category3.id,
-            url="https://example.com/rich-dad"
-        )
-        
-        create_book(
-            db,
-            title="Самый богатый человек в Вавилоне",
-            description="Классика финансовой литературы",
-            price=750.00,
-            category_id=category3.id,
-            url="https://example.com/babylon"
-        )
-        
-        create_book(
-            db,
-            title="7 навыков высокоэффективных людей",
-            description="Книга о личной и профессиональной эффективности",
-            price=1300.00,
-            category_id=category3.id,
-            url="https://example.com/7-habits"
-        )
-        
+
         print("✅ База данных успешно инициализирована!")
-        print(f"   Добавлено категорий: 3")
-        print(f"   Добавлено книг: 7")
-        
+        print(f"   Добавлено категорий: {len(SAMPLE_CATALOG)}")
+        print(f"   Добавлено книг: {len(books)}")
+
     except Exception as e:
         print(f"❌ Ошибка при инициализации базы данных: {e}")
-        db.rollback()
     finally:
-        db.close()
+        await engine.dispose()
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    asyncio.run(init_database())
@@ -1,22 +1,70 @@
 # app/main.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
-import sys
+import asyncio
+import logging
 import os
+import time
 from sqlalchemy import text
 
-# Добавляем родительскую директорию в путь Python
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
-
-from app.db.db import engine, Base
+from app.db.db import DB_POOL_WARMUP, engine, replica_engine, Base
+from app.db.cache import cache
+from app.db.pool import pool_status, warm_up_pool
+from app.db.replica import ReadYourWritesMiddleware, replica_status
+from app.admission import ADMISSION_ENABLED, AdmissionMiddleware, admission_stats
+from app.coalescing import COALESCE_ENABLED, CoalescingMiddleware, single_flight
+from app.compression import CompressionMiddleware, page_cache
+from app.metrics import MetricsMiddleware, instrument_engine, registry
+from app import query_budget
+from app.db import models  # noqa: F401 (регистрация моделей в Base.metadata)
 from app.api import books, categories
 from app.schemas import HealthCheck
 
-# Создаем таблицы (если их нет)
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Режим запуска: development или production
+APP_ENV = os.getenv("APP_ENV", "development")
+PRODUCTION = APP_ENV == "production"
+# Создание таблиц при старте; в production схемой управляют миграции
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "0" if PRODUCTION else "1") == "1"
+# Предел ожидания проверки БД в /ready, секунды
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Запуск и остановка воркера
+
+    Воркер становится готовым (/ready) только после прогрева: таблицы
+    (кроме production), соединения пула и схема OpenAPI.
+    """
+    started = time.perf_counter()
+    if DB_CREATE_SCHEMA:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    connections = await warm_up_pool(engine, DB_POOL_WARMUP)
+    if replica_engine is not None:
+        try:
+            connections += await warm_up_pool(replica_engine, DB_POOL_WARMUP)
+        except Exception as e:
+            # Недоступная реплика не мешает старту: чтение пойдет с основной БД
+            logger.warning("Не удалось прогреть пул реплики: %s", e)
+    # Схемы Pydantic и OpenAPI строятся при первом обращении — делаем это до трафика
+    app.openapi()
+    app.state.ready = True
+    logger.info("Воркер готов за %.3f с (%s, соединений в пуле: %d)",
+                time.perf_counter() - started, APP_ENV, connections)
+    try:
+        yield
+    finally:
+        # Балансировщик перестает слать запросы, пока соединения закрываются
+        app.state.ready = False
+        await engine.dispose()
+        if replica_engine is not None:
+            await replica_engine.dispose()
 
 # Создаем приложение FastAPI
 app = FastAPI(
@@ -25,7 +73,24 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
+app.state.ready = False
+
+# Сжатие ответов (zstd/gzip) и кэш сжатых страниц GET /books/.
+# Добавляется первым, чтобы CORS обрабатывал и ответы из кэша
+app.add_middleware(CompressionMiddleware)
+
+# Допуск запросов к books/categories: пределы по классам чтение/запись и 503
+# при перегрузке. Внутри CORS и метрик: отказы получают заголовки CORS,
+# а время ожидания в очереди входит в задержку запроса
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+# Объединение одинаковых одновременных GET /books: снаружи допуска,
+# чтобы ожидающие запросы не занимали слоты
+if COALESCE_ENABLED:
+    app.add_middleware(CoalescingMiddleware)
 
 # Настраиваем CORS (Cross-Origin Resource Sharing)
 app.add_middleware(
@@ -34,14 +99,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
+# Чтение своих записей: после записи клиент какое-то время читает с основной БД
+if replica_engine is not None:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+# Метрики: время ответа по маршрутам и SQL-запросы на каждый HTTP-запрос
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine.sync_engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine.sync_engine)
+
+# Детектор N+1 и превышения бюджета SQL-запросов (QUERY_BUDGET_MODE=log|raise)
+if query_budget.QUERY_BUDGET_MODE != "off":
+    app.add_middleware(query_budget.QueryBudgetMiddleware)
+    query_budget.instrument_engine(engine.sync_engine)
+    if replica_engine is not None:
+        query_budget.instrument_engine(replica_engine.sync_engine)
+
 # Подключаем роутеры
 app.include_router(categories.router)
 app.include_router(books.router)
 
 @app.get("/", tags=["Root"])
-def read_root():
+async def read_root():
     """
     Корневой эндпоинт
     """
@@ -52,15 +135,15 @@ def read_root():
     }
 
 @app.get("/health", response_model=HealthCheck, tags=["Health"])
-def health_check():
+async def health_check():
     """
     Проверка состояния API и базы данных
     """
     try:
         # Проверяем подключение к БД
-        with engine.connect() as conn:
+        async with engine.connect() as conn:
             # Используем text() для SQL-запроса
-            conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception as e:
         db_status = f"disconnected: {str(e)}"
@@ -71,13 +154,94 @@ def health_check():
         database=db_status
     )
 
-# Для запуска через python app/main.py
+@app.get("/live", tags=["Health"])
+async def liveness():
+    """
+    Проверка, что процесс жив (без обращения к БД)
+    """
+    return {"status": "alive"}
+
+@app.get("/ready", tags=["Health"])
+async def readiness():
+    """
+    Готовность принимать трафик: прогрев завершен и БД отвечает
+
+    Пока воркер прогревается или останавливается, возвращается 503.
+    """
+    if not app.state.ready:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "starting"}
+        )
+    try:
+        async with engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), READY_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "database": str(e) or type(e).__name__}
+        )
+    return {"status": "ready"}
+
+@app.get("/health/cache", tags=["Health"])
+async def cache_stats():
+    """
+    Статистика кэша сущностей (попадания, промахи, размер)
+    """
+    return cache.stats()
+
+@app.get("/health/page-cache", tags=["Health"])
+async def page_cache_stats():
+    """
+    Статистика кэша сжатых страниц списка книг
+    """
+    return page_cache.stats()
+
+@app.get("/health/admission", tags=["Health"])
+async def admission_status():
+    """
+    Допуск запросов: выполняющиеся и ожидающие запросы, отказы по классам
+    """
+    return admission_stats()
+
+@app.get("/health/coalescing", tags=["Health"])
+async def coalescing_stats():
+    """
+    Объединение одинаковых одновременных запросов (single-flight)
+    """
+    return single_flight.stats()
+
+@app.get("/health/pool", tags=["Health"])
+async def pool_stats():
+    """
+    Состояние пула соединений с БД (занятые соединения, overflow, ожидание выдачи)
+    """
+    return pool_status(engine.pool)
+
+@app.get("/health/replica", tags=["Health"])
+async def replica_stats():
+    """
+    Состояние реплики для чтения (доступность, ошибки, пул соединений)
+    """
+    return replica_status()
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+async def metrics():
+    """
+    Метрики в текстовом формате Prometheus
+    """
+    return PlainTextResponse(
+        registry.exposition(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# Для запуска через python -m app.main (в production — без автоперезагрузки)
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=not PRODUCTION,
         log_level="info"
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,263 @@
+# app/metrics.py
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Счетчик с метками в формате Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Текущее значение с метками в формате Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Гистограмма с метками в формате Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: счетчики корзин (последняя — +Inf), сумма
+        self._values: Dict[LabelValues, Tuple[list, list]] = {}
+
+    def observe(self, *labels: str, value: float):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = ([0] * (len(self.buckets) + 1), [0.0])
+            self._values[labels] = entry
+        counts, total = entry
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def collect(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return "\n".join(lines)
+
+
+class Registry:
+    """Набор метрик, отдаваемых на /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def exposition(self) -> str:
+        return "\n".join(metric.collect() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "Количество HTTP-запросов", ("method", "route", "status")
+))
+ERRORS = registry.register(Counter(
+    "http_request_errors_total", "Количество запросов, завершившихся ошибкой 5xx", ("method", "route")
+))
+LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route")
+))
+DB_QUERIES = registry.register(Histogram(
+    "db_queries_per_request", "Количество SQL-запросов на один HTTP-запрос",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS
+))
+DB_TIME = registry.register(Histogram(
+    "db_time_per_request_seconds", "Суммарное время SQL-запросов на один HTTP-запрос",
+    ("method", "route")
+))
+DB_STATEMENTS = registry.register(Counter(
+    "db_statements_total", "Количество SQL-запросов по маршрутам", ("route",)
+))
+PAGE_CACHE_REQUESTS = registry.register(Counter(
+    "http_page_cache_requests_total", "Запросы кэшируемых страниц по результату (hit/miss)",
+    ("result",)
+))
+ADMISSION_IN_FLIGHT = registry.register(Gauge(
+    "admission_in_flight", "Запросы, выполняющиеся сейчас, по классу маршрутов", ("route_class",)
+))
+ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    "admission_queue_depth", "Запросы, ожидающие допуска, по классу маршрутов", ("route_class",)
+))
+ADMISSION_QUEUE_WAIT = registry.register(Histogram(
+    "admission_queue_wait_seconds", "Время ожидания допуска к выполнению", ("route_class",)
+))
+ADMISSION_REJECTED = registry.register(Counter(
+    "admission_rejected_total", "Запросы, отклоненные с 503 (queue_full — очередь полна, "
+    "timeout — истек срок ожидания)", ("route_class", "reason")
+))
+COALESCED_REQUESTS = registry.register(Counter(
+    "http_coalesced_requests_total", "Запросы, ожидавшие такой же выполняющийся запрос "
+    "(shared — получили его ответ, timeout/fallback — выполнились сами)", ("result",)
+))
+DB_READ_SESSIONS = registry.register(Counter(
+    "db_read_sessions_total", "Сессии чтения по БД (replica/primary) и причине выбора основной БД",
+    ("target", "reason")
+))
+
+
+# ========== Учет SQL-запросов текущего HTTP-запроса ==========
+
+class RequestStats:
+    """SQL-запросы, выполненные в рамках одного HTTP-запроса"""
+
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время начала хранится в контексте выполнения, а не в conn.info:
+    # контекст живет один запрос, и при ошибке SQL в нем ничего не остается
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    started = getattr(context, "_query_start", None)
+    if started is not None:
+        stats.db_time += time.perf_counter() - started
+
+
+def instrument_engine(engine: Engine):
+    """Подписка на события выполнения SQL движка (для AsyncEngine — его sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ========== ASGI middleware ==========
+
+class MetricsMiddleware:
+    """
+    Сбор метрик по шаблону маршрута (`/books/{book_id}`), а не по пути,
+    чтобы число временных рядов не зависело от ID в запросах.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+
+            REQUESTS.inc(method, route_path, str(status_code))
+            if status_code >= 500:
+                ERRORS.inc(method, route_path)
+            LATENCY.observe(method, route_path, value=duration)
+            DB_QUERIES.observe(method, route_path, value=stats.statements)
+            DB_TIME.observe(method, route_path, value=stats.db_time)
+            DB_STATEMENTS.inc(route_path, amount=stats.statements)
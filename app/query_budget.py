@@ -0,0 +1,159 @@
+# app/query_budget.py
+import logging
+import os
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Режим проверки: off — выключено, log — предупреждение в лог, raise — ошибка запроса
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off")
+# Сколько раз один и тот же запрос может повториться, прежде чем это считается N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+
+# Атрибут обработчика с объявленным бюджетом запросов
+BUDGET_ATTRIBUTE = "__query_budget__"
+# Значение бюджета, отключающее проверки для маршрута
+UNLIMITED = None
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Маршрут выполнил больше SQL-запросов, чем объявлено, или повторяет один запрос"""
+
+
+def query_budget(max_queries: Optional[int]) -> Callable:
+    """
+    Объявление бюджета SQL-запросов для обработчика маршрута
+
+    Декоратор ставится под `@router.get(...)`. Бюджет None отключает
+    проверки для маршрутов, где число запросов зависит от объема данных.
+    """
+    def decorator(func):
+        setattr(func, BUDGET_ATTRIBUTE, max_queries)
+        return func
+    return decorator
+
+
+def route_budget(endpoint) -> Optional[int]:
+    """Объявленный бюджет обработчика (None — бюджета нет)"""
+    return getattr(endpoint, BUDGET_ATTRIBUTE, UNLIMITED)
+
+
+def has_budget(endpoint) -> bool:
+    """Объявлен ли бюджет (в том числе явный None)"""
+    return hasattr(endpoint, BUDGET_ATTRIBUTE)
+
+
+class QueryRecorder:
+    """SQL-запросы одного HTTP-запроса или блока кода с разбивкой по тексту запроса"""
+
+    def __init__(self, scope: Optional[dict] = None, mode: str = "log"):
+        self.scope = scope
+        self.mode = mode
+        self.count = 0
+        self.shapes: Counter = Counter()
+        self.reported = False
+
+    @property
+    def endpoint(self):
+        return self.scope.get("endpoint") if self.scope else None
+
+    @property
+    def route_path(self) -> str:
+        route = self.scope.get("route") if self.scope else None
+        return getattr(route, "path", None) or "unknown"
+
+    def repeated(self) -> Dict[str, int]:
+        """Запросы одной формы, выполненные QUERY_REPEAT_THRESHOLD и более раз"""
+        return {
+            statement: times for statement, times in self.shapes.items()
+            if times >= QUERY_REPEAT_THRESHOLD
+        }
+
+    def problems(self) -> list:
+        """Нарушения бюджета и подозрения на N+1 для текущего маршрута"""
+        endpoint = self.endpoint
+        if endpoint is not None and has_budget(endpoint) and route_budget(endpoint) is UNLIMITED:
+            return []
+        problems = []
+        budget = route_budget(endpoint)
+        if budget is not None and self.count > budget:
+            problems.append(f"выполнено {self.count} SQL-запросов при бюджете {budget}")
+        for statement, times in self.repeated().items():
+            problems.append(f"запрос повторен {times} раз (возможен N+1): {statement[:200]}")
+        return problems
+
+    def record(self, statement: str):
+        self.count += 1
+        self.shapes[statement] += 1
+        # В режиме raise запрос прерывается на первом же нарушении
+        if self.mode == "raise":
+            problems = self.problems()
+            if problems:
+                self.reported = True
+                raise QueryBudgetExceeded(f"{self.route_path}: " + "; ".join(problems))
+
+    def report(self):
+        """Итоговая проверка после завершения запроса"""
+        if self.reported:
+            return
+        problems = self.problems()
+        if problems:
+            logger.warning("Бюджет SQL-запросов нарушен на %s: %s",
+                           self.route_path, "; ".join(problems))
+
+
+_recorder: ContextVar[Optional[QueryRecorder]] = ContextVar("query_recorder", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.record(statement)
+
+
+def instrument_engine(engine: Engine):
+    """Подписка детектора на выполнение SQL движка (для AsyncEngine — его sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def record_queries(mode: str = "log") -> Iterator[QueryRecorder]:
+    """
+    Запись SQL-запросов внутри блока кода
+
+    Удобно в тестах: `with record_queries() as queries: ...`, затем
+    проверка `queries.count` или `queries.problems()`.
+    """
+    recorder = QueryRecorder(mode=mode)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+class QueryBudgetMiddleware:
+    """Проверка бюджета SQL-запросов для каждого HTTP-запроса"""
+
+    def __init__(self, app, mode: str = QUERY_BUDGET_MODE):
+        self.app = app
+        self.mode = mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder = QueryRecorder(scope=scope, mode=self.mode)
+        token = _recorder.set(recorder)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _recorder.reset(token)
+            recorder.report()
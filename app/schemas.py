@@ -1,5 +1,5 @@
 # app/schemas.py
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 
@@ -25,6 +25,22 @@ class Category(CategoryBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class PriceBucket(BaseModel):
+    """Корзина гистограммы цен: [min, max)"""
+    min: float
+    max: Optional[float] = Field(None, description="Верхняя граница (null — без ограничения)")
+    count: int
+
+class CategoryStats(BaseModel):
+    """Сводка по книгам категории"""
+    category_id: int
+    title: str
+    books_count: int
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    price_avg: Optional[float] = None
+    histogram: List[PriceBucket] = []
+
 # ========== Схемы для книг ==========
 
 class BookBase(BaseModel):
@@ -53,6 +69,69 @@ class Book(BookBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class BookCategoryFacet(BaseModel):
+    """Количество найденных книг в категории"""
+    id: int
+    title: str
+    count: int
+
+class BookFacets(BaseModel):
+    """Фасеты поиска книг (только запрошенные)"""
+    category: Optional[List[BookCategoryFacet]] = None
+    price: Optional[List[PriceBucket]] = None
+
+class BookSearchPage(BaseModel):
+    """Страница книг с фасетами (GET /books/?facets=...)"""
+    items: List[Book]
+    facets: BookFacets
+
+class BookImportError(BaseModel):
+    """Ошибка импорта одной строки"""
+    row: int = Field(..., description="Номер строки во входном файле")
+    detail: str
+
+class BookImportReport(BaseModel):
+    """Отчет о массовом импорте книг"""
+    inserted: int = 0
+    failed: int = 0
+    errors: List[BookImportError] = []
+    errors_truncated: bool = Field(False, description="В отчет попали не все ошибки")
+
+# Предел элементов в одном пакетном запросе
+BOOK_BATCH_MAX_ITEMS = 1000
+
+class BookBatchIds(BaseModel):
+    """Список ID книг для пакетного чтения или удаления"""
+    ids: List[int] = Field(..., min_length=1, max_length=BOOK_BATCH_MAX_ITEMS)
+
+class BookPatch(BaseModel):
+    """Частичное обновление книги: меняются только переданные поля"""
+    id: int
+    title: Optional[str] = Field(None, min_length=1, max_length=200)
+    description: Optional[str] = Field(None, max_length=2000)
+    price: Optional[float] = Field(None, ge=0)
+    url: Optional[str] = Field(None, max_length=500)
+    category_id: Optional[int] = Field(None)
+
+    @field_validator("title", "price", "category_id")
+    @classmethod
+    def not_null(cls, value, info):
+        """Поле можно не передавать, но нельзя обнулить: колонка NOT NULL"""
+        if value is None:
+            raise ValueError(f"Поле {info.field_name} не может быть null")
+        return value
+
+class BookBatchUpdate(BaseModel):
+    """Пакетное частичное обновление книг"""
+    items: List[BookPatch] = Field(..., min_length=1, max_length=BOOK_BATCH_MAX_ITEMS)
+
+class BookBatchResult(BaseModel):
+    """Результат пакетной операции для одной книги"""
+    id: int
+    status: int = Field(..., description="HTTP-статус операции для этой книги")
+    detail: Optional[str] = None
+    book: Optional[Book] = None
+
 # ========== Схемы для ответов API ==========
 
 class HealthCheck(BaseModel):
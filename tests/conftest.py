@@ -0,0 +1,120 @@
+# tests/conftest.py
+"""
+Общие фикстуры тестов
+
+Приложение работает на временной SQLite-базе в режиме QUERY_BUDGET_MODE=raise:
+превышение бюджета SQL-запросов или N+1 превращается в ошибку запроса.
+Кэши и объединение запросов выключены, чтобы каждый запрос доходил до БД
+и число SQL-запросов было детерминированным. Переменные окружения задаются
+до импорта приложения: модули читают их при импорте.
+"""
+import os
+import tempfile
+
+DATABASE_DIR = tempfile.mkdtemp(prefix="bookstore-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(DATABASE_DIR, 'test.db')}"
+os.environ["DATABASE_REPLICA_URL"] = ""
+os.environ["QUERY_BUDGET_MODE"] = "raise"
+os.environ["CACHE_ENABLED"] = "0"
+os.environ["PAGE_CACHE_ENABLED"] = "0"
+os.environ["COALESCE_ENABLED"] = "0"
+os.environ["ADMISSION_ENABLED"] = "0"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db.db import Base, engine
+from app.main import app
+from app.query_budget import route_budget
+
+
+class StatementLog:
+    """SQL-запросы, выполненные движком с момента последнего clear()"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def clear(self):
+        self.statements.clear()
+
+    def assert_within_budget(self, endpoint):
+        """Проверка, что запросы уложились в объявленный бюджет обработчика"""
+        budget = route_budget(endpoint)
+        assert budget is not None, f"у {endpoint.__name__} нет бюджета SQL-запросов"
+        assert self.count <= budget, (
+            f"{endpoint.__name__}: {self.count} SQL-запросов при бюджете {budget}:\n"
+            + "\n".join(self.statements)
+        )
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Клиент приложения; lifespan создает таблицы"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def clean_db(client):
+    """Пустая схема перед каждым тестом"""
+    async def recreate():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    client.portal.call(recreate)
+
+
+@pytest.fixture(scope="session")
+def statement_log():
+    log = StatementLog()
+    event.listen(engine.sync_engine, "before_cursor_execute", log)
+    yield log
+    event.remove(engine.sync_engine, "before_cursor_execute", log)
+
+
+@pytest.fixture
+def sql(statement_log):
+    """Журнал SQL-запросов теста; очищается перед проверяемым запросом"""
+    statement_log.clear()
+    return statement_log
+
+
+def create_catalog(client, categories: int = 3, books: int = 12) -> dict:
+    """Категории и книги через API; возвращает их ID"""
+    category_ids = []
+    for index in range(categories):
+        response = client.post("/categories/", json={"title": f"Категория {index}"})
+        assert response.status_code == 201, response.text
+        category_ids.append(response.json()["id"])
+
+    book_ids = []
+    for index in range(books):
+        response = client.post("/books/", json={
+            "title": f"Книга {index}",
+            "description": f"Описание книги {index}",
+            "price": 100 + index * 450,
+            "category_id": category_ids[index % categories],
+        })
+        assert response.status_code == 201, response.text
+        book_ids.append(response.json()["id"])
+    return {"categories": category_ids, "books": book_ids}
+
+
+@pytest.fixture
+def catalog(client) -> dict:
+    return create_catalog(client)
+
+
+@pytest.fixture
+def catalog_factory(client):
+    """create_catalog с настраиваемым числом категорий и книг"""
+    return lambda **sizes: create_catalog(client, **sizes)
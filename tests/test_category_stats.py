@@ -0,0 +1,122 @@
+# tests/test_category_stats.py
+"""Сводка category_stats совпадает с агрегатами по книгам после любых записей"""
+import asyncio
+import random
+
+from sqlalchemy import func, select
+
+from app.db import crud, models
+from app.db.db import SessionLocal
+
+
+async def _expected_stats() -> dict:
+    """Сводка, посчитанная заново по таблице книг"""
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(
+                models.Book.category_id,
+                func.count(),
+                func.min(models.Book.price),
+                func.max(models.Book.price),
+                func.sum(models.Book.price),
+            ).group_by(models.Book.category_id)
+        )
+        return {row[0]: tuple(row[1:]) for row in result}
+
+
+async def _actual_stats() -> dict:
+    async with SessionLocal() as db:
+        rows = await crud.get_category_stats(db)
+    return {
+        row.category_id: (row.books_count, row.price_min, row.price_max, row.price_sum)
+        for row in rows if row.books_count
+    }
+
+
+async def _rebuilt_stats() -> dict:
+    """Сводка после полного пересчета refresh_category_stats"""
+    async with SessionLocal() as db:
+        await crud.refresh_category_stats(db)
+        await db.commit()
+    return await _actual_stats()
+
+
+def _assert_consistent(client):
+    expected = client.portal.call(_expected_stats)
+    actual = client.portal.call(_actual_stats)
+    assert actual.keys() == expected.keys()
+    for category_id, (count, low, high, total) in expected.items():
+        assert actual[category_id][:3] == (count, low, high)
+        assert abs(actual[category_id][3] - total) < 1e-6
+
+
+def test_stats_follow_book_writes(client, catalog):
+    category_ids, book_ids = catalog["categories"], catalog["books"]
+    _assert_consistent(client)
+
+    # Удаление книги с минимальной ценой категории пересчитывает границу
+    cheapest = min(client.get("/books/", params={"category_id": category_ids[0]}).json(),
+                   key=lambda book: book["price"])
+    assert client.delete(f"/books/{cheapest['id']}").status_code == 204
+    _assert_consistent(client)
+
+    client.put(f"/books/{book_ids[1]}", json={
+        "title": "Перенесенная книга", "price": 10_000, "category_id": category_ids[2],
+    })
+    client.patch("/books/batch", json={"items": [
+        {"id": book_ids[2], "price": 1}, {"id": book_ids[3], "category_id": category_ids[1]},
+    ]})
+    client.post("/books/batch-delete", json={"ids": book_ids[4:8]})
+    _assert_consistent(client)
+
+    # Категория без книг: границы сбрасываются, сумма обнуляется
+    remaining = [book["id"] for book in client.get("/books/", params={"limit": 1000}).json()]
+    client.post("/books/batch-delete", json={"ids": remaining})
+    response = client.get(f"/categories/{category_ids[0]}/stats").json()
+    assert (response["books_count"], response["price_min"], response["price_max"]) == (0, None, None)
+
+
+def test_concurrent_writes_keep_stats_consistent(client, catalog):
+    """Одновременные вставки, изменения и удаления в одних категориях не теряют обновлений"""
+    category_ids, book_ids = catalog["categories"], catalog["books"]
+    rng = random.Random(7)
+
+    async def create(index: int):
+        async with SessionLocal() as db:
+            await crud.create_book(db, f"Параллельная книга {index}", "",
+                                   round(rng.uniform(1, 6000), 2), rng.choice(category_ids))
+
+    async def move(book_id: int):
+        async with SessionLocal() as db:
+            await crud.update_book(db, book_id, f"Перемещенная книга {book_id}", "",
+                                   round(rng.uniform(1, 6000), 2), rng.choice(category_ids))
+
+    async def remove(book_id: int):
+        async with SessionLocal() as db:
+            await crud.delete_book(db, book_id)
+
+    async def run():
+        await asyncio.gather(
+            *(create(index) for index in range(30)),
+            *(move(book_id) for book_id in book_ids[:6]),
+            *(remove(book_id) for book_id in book_ids[6:]),
+        )
+
+    client.portal.call(run)
+    _assert_consistent(client)
+
+
+def test_batch_patch_moving_books_matches_rebuild(client, catalog):
+    category_ids, book_ids = catalog["categories"], catalog["books"]
+    response = client.patch("/books/batch", json={"items": [
+        {"id": book_ids[0], "category_id": category_ids[1]},
+        {"id": book_ids[1], "category_id": category_ids[2], "price": 9_999},
+        {"id": book_ids[2], "category_id": category_ids[0], "price": 1},
+        {"id": book_ids[3], "title": "Только название"},
+        {"id": 10_000, "category_id": category_ids[0]},
+    ]})
+    assert [item["status"] for item in response.json()] == [200, 200, 200, 200, 404]
+
+    incremental = client.portal.call(_actual_stats)
+    assert incremental == client.portal.call(_rebuilt_stats)
+
@@ -0,0 +1,53 @@
+# tests/test_conditional.py
+"""ETag списка книг меняется вместе с составом страницы"""
+from sqlalchemy import insert
+
+from app.db import crud, models
+from app.db.db import SessionLocal
+
+
+def _seed_same_timestamp(client, prices: dict) -> int:
+    """Книги с одной отметкой изменения, как после генератора данных"""
+    category_id = client.post("/categories/", json={"title": "Категория"}).json()["id"]
+    updated_at = models.utcnow()
+
+    async def seed():
+        async with SessionLocal() as db:
+            await db.execute(insert(models.Book), [
+                {"id": book_id, "title": f"Книга {book_id}", "price": price,
+                 "category_id": category_id, "updated_at": updated_at}
+                for book_id, price in prices.items()
+            ])
+            await crud.refresh_category_stats(db)
+            await db.commit()
+
+    client.portal.call(seed)
+    return category_id
+
+
+def test_not_modified_only_for_same_page(client):
+    _seed_same_timestamp(client, {1: 10, 4: 20, 2: 30, 3: 40})
+    params = {"sort": "price", "limit": 2}
+    response = client.get("/books/", params=params)
+    assert [book["id"] for book in response.json()] == [1, 4]
+    etag = response.headers["etag"]
+
+    assert client.get("/books/", params=params, headers={"If-None-Match": etag}).status_code == 304
+
+    # Те же количество, сумма ID и последняя отметка изменения, но другие книги
+    client.post("/books/batch-delete", json={"ids": [1, 4]})
+    response = client.get("/books/", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [book["id"] for book in response.json()] == [2, 3]
+    assert response.headers["etag"] != etag
+
+
+def test_not_modified_after_reordering(client):
+    _seed_same_timestamp(client, {1: 10, 2: 20})
+    params = {"sort": "price"}
+    etag = client.get("/books/", params=params).headers["etag"]
+
+    client.patch("/books/batch", json={"items": [{"id": 1, "price": 30}]})
+    response = client.get("/books/", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [book["id"] for book in response.json()] == [2, 1]
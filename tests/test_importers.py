@@ -0,0 +1,64 @@
+# tests/test_importers.py
+"""Потоковый импорт: нечитаемые и слишком длинные строки попадают в отчет"""
+import asyncio
+import json
+
+from app.api.importers import MAX_LINE_BYTES, iter_csv_records, iter_ndjson_records
+
+
+async def _chunks(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _records(reader, data: bytes) -> list:
+    async def collect():
+        return [record async for record in reader(_chunks(data))]
+    return asyncio.run(collect())
+
+
+def _book(title: str) -> bytes:
+    return json.dumps({"title": title, "price": 1, "category_id": 1}).encode()
+
+
+def test_ndjson_invalid_utf8_is_row_error():
+    data = b"\n".join([_book("Первая"), b'{"title": "\xff\xfe"}', _book("Третья")])
+    records = _records(iter_ndjson_records, data)
+    assert [(row, error is None) for row, _, error in records] == [(1, True), (2, False), (3, True)]
+    assert "UTF-8" in records[1][2]
+
+
+def test_ndjson_overlong_line_is_skipped():
+    data = b"\n".join([_book("Первая"), b"x" * (MAX_LINE_BYTES * 3), _book("Третья")])
+    records = _records(iter_ndjson_records, data)
+    assert [(row, error is None) for row, _, error in records] == [(1, True), (2, False), (3, True)]
+    assert records[2][1]["title"] == "Третья"
+
+
+def test_overlong_last_line_without_newline():
+    records = _records(iter_ndjson_records, _book("Первая") + b"\n" + b"x" * (MAX_LINE_BYTES + 1))
+    assert [(row, error is None) for row, _, error in records] == [(1, True), (2, False)]
+
+
+def test_csv_invalid_utf8_and_unclosed_quote():
+    data = "\n".join([
+        "title,description,price,url,category_id",
+        "Первая,,1,,1",
+    ]).encode() + b"\n\xff,,1,,1\n" + b'"' + (b"x" * 1023 + b"\n") * 1025
+    records = _records(iter_csv_records, data)
+    assert records[0][2] is None
+    assert "UTF-8" in records[1][2]
+    assert any("длиннее" in (error or "") for _, _, error in records[2:])
+
+
+def test_bulk_endpoint_reports_invalid_utf8(client, catalog):
+    body = b"\n".join([
+        json.dumps({"title": "Новая", "price": 1, "category_id": catalog["categories"][0]}).encode(),
+        b"\xc3\x28",
+    ])
+    response = client.post("/books/bulk", content=body,
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["row"] == 2
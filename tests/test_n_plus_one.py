@@ -0,0 +1,47 @@
+# tests/test_n_plus_one.py
+"""Число SQL-запросов чтения книг не растет с числом книг (нет N+1)"""
+import pytest
+
+from app.api import books
+
+
+def _statements(client, sql, url: str) -> int:
+    sql.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return sql.count
+
+
+def _add_books(client, category_ids, books: int):
+    for index in range(books):
+        response = client.post("/books/", json={
+            "title": f"Дополнительная книга {index}",
+            "price": index,
+            "category_id": category_ids[index % len(category_ids)],
+        })
+        assert response.status_code == 201, response.text
+
+
+@pytest.mark.parametrize("params", [{}, {"fields": "id,title,category"}, {"facets": "category"}])
+def test_read_books_constant_statements(client, catalog_factory, sql, params):
+    catalog = catalog_factory(categories=3, books=5)
+    few = _statements(client, sql, client.build_request("GET", "/books/", params=params).url)
+
+    _add_books(client, catalog["categories"], books=40)
+    many = _statements(client, sql, client.build_request("GET", "/books/", params=params).url)
+
+    assert many == few
+
+
+def test_read_books_returns_all_seeded(client, catalog_factory, sql):
+    catalog_factory(categories=3, books=45)
+    sql.clear()
+    response = client.get("/books/?limit=1000")
+    assert len(response.json()) == 45
+    sql.assert_within_budget(books.read_books)
+
+
+def test_read_book_constant_statements(client, catalog_factory, sql):
+    catalog = catalog_factory(categories=3, books=30)
+    counts = {_statements(client, sql, f"/books/{book_id}") for book_id in catalog["books"]}
+    assert counts == {1}
@@ -0,0 +1,178 @@
+# tests/test_query_budget.py
+"""Каждый маршрут books и categories укладывается в объявленный бюджет SQL-запросов"""
+import json
+
+from app.api import books, categories
+from app.api.books import BULK_BATCH_SIZE
+
+
+# ========== Книги ==========
+
+def test_read_books(client, catalog, sql):
+    response = client.get("/books/", params={"limit": 5})
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+    sql.assert_within_budget(books.read_books)
+
+
+def test_read_books_filtered_with_fields(client, catalog, sql):
+    response = client.get("/books/", params={
+        "category_id": catalog["categories"][0], "min_price": 100,
+        "sort": "price", "fields": "id,title,price",
+    })
+    assert response.status_code == 200
+    assert set(response.json()[0]) == {"id", "title", "price"}
+    sql.assert_within_budget(books.read_books)
+
+
+def test_read_books_not_modified(client, catalog, sql):
+    etag = client.get("/books/").headers["etag"]
+    sql.clear()
+    response = client.get("/books/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    sql.assert_within_budget(books.read_books)
+
+
+def test_read_books_with_facets(client, catalog, sql):
+    response = client.get("/books/", params={"facets": "category,price", "limit": 3})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 3
+    sql.assert_within_budget(books.read_books)
+
+
+def test_read_books_text_search(client, catalog, sql):
+    response = client.get("/books/", params={"q": "Книга"})
+    assert response.status_code == 200
+    sql.assert_within_budget(books.read_books)
+
+
+def test_export_books(client, catalog, sql):
+    response = client.get("/books/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == len(catalog["books"]) + 1
+    sql.assert_within_budget(books.export_books)
+
+
+def test_batch_get_books(client, catalog, sql):
+    response = client.post("/books/batch-get", json={"ids": catalog["books"] + [10_000]})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()].count(404) == 1
+    sql.assert_within_budget(books.batch_get_books)
+
+
+def test_batch_update_books(client, catalog, sql):
+    book_ids = catalog["books"]
+    response = client.patch("/books/batch", json={"items": [
+        {"id": book_ids[0], "price": 10},
+        {"id": book_ids[1], "title": "Новое название"},
+        {"id": book_ids[2], "category_id": catalog["categories"][1], "url": "https://example.com"},
+        {"id": book_ids[3], "description": None},
+        {"id": 10_000, "price": 1},
+    ]})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == [200, 200, 200, 200, 404]
+    sql.assert_within_budget(books.batch_update_books)
+
+
+def test_batch_delete_books(client, catalog, sql):
+    response = client.post("/books/batch-delete", json={"ids": catalog["books"][:5]})
+    assert response.status_code == 200
+    sql.assert_within_budget(books.batch_delete_books)
+
+
+def test_read_book(client, catalog, sql):
+    response = client.get(f"/books/{catalog['books'][0]}")
+    assert response.status_code == 200
+    assert response.json()["category"]["id"] == catalog["categories"][0]
+    sql.assert_within_budget(books.read_book)
+
+
+def test_create_book(client, catalog, sql):
+    response = client.post("/books/", json={
+        "title": "Еще одна книга", "price": 300, "category_id": catalog["categories"][2],
+    })
+    assert response.status_code == 201
+    sql.assert_within_budget(books.create_book)
+
+
+def test_update_book(client, catalog, sql):
+    response = client.put(f"/books/{catalog['books'][0]}", json={
+        "title": "Переименованная книга", "price": 700, "category_id": catalog["categories"][1],
+    })
+    assert response.status_code == 200
+    sql.assert_within_budget(books.update_book)
+
+
+def test_delete_book(client, catalog, sql):
+    response = client.delete(f"/books/{catalog['books'][0]}")
+    assert response.status_code == 204
+    sql.assert_within_budget(books.delete_book)
+
+
+def test_bulk_create_books_per_batch(client, catalog, sql):
+    """У импорта нет общего бюджета, но число запросов не зависит от числа строк в пачке"""
+    def ndjson(rows: int, prefix: str) -> str:
+        return "\n".join(json.dumps({
+            "title": f"{prefix} {index}", "price": index,
+            "category_id": catalog["categories"][index % 3],
+        }) for index in range(rows))
+
+    headers = {"Content-Type": "application/x-ndjson"}
+    response = client.post("/books/bulk", content=ndjson(1, "Одна"), headers=headers)
+    assert response.json()["inserted"] == 1
+    one_batch = sql.count
+
+    sql.clear()
+    rows = BULK_BATCH_SIZE * 3
+    response = client.post("/books/bulk", content=ndjson(rows, "Много"), headers=headers)
+    assert response.json()["inserted"] == rows
+    assert sql.count <= 3 * one_batch
+
+
+# ========== Категории ==========
+
+def test_read_categories(client, catalog, sql):
+    response = client.get("/categories/")
+    assert response.status_code == 200
+    assert [item["books_count"] for item in response.json()] == [4, 4, 4]
+    sql.assert_within_budget(categories.read_categories)
+
+
+def test_read_categories_stats(client, catalog, sql):
+    response = client.get("/categories/stats")
+    assert response.status_code == 200
+    assert sum(item["books_count"] for item in response.json()) == len(catalog["books"])
+    sql.assert_within_budget(categories.read_categories_stats)
+
+
+def test_read_category_stats(client, catalog, sql):
+    response = client.get(f"/categories/{catalog['categories'][0]}/stats")
+    assert response.status_code == 200
+    sql.assert_within_budget(categories.read_category_stats)
+
+
+def test_read_category(client, catalog, sql):
+    response = client.get(f"/categories/{catalog['categories'][0]}")
+    assert response.status_code == 200
+    sql.assert_within_budget(categories.read_category)
+
+
+def test_create_category(client, sql):
+    response = client.post("/categories/", json={"title": "Новая категория"})
+    assert response.status_code == 201
+    sql.assert_within_budget(categories.create_category)
+
+
+def test_update_category(client, catalog, sql):
+    response = client.put(f"/categories/{catalog['categories'][0]}",
+                          json={"title": "Переименованная категория"})
+    assert response.status_code == 200
+    sql.assert_within_budget(categories.update_category)
+
+
+def test_delete_category(client, sql):
+    category_id = client.post("/categories/", json={"title": "Пустая"}).json()["id"]
+    sql.clear()
+    response = client.delete(f"/categories/{category_id}")
+    assert response.status_code == 204
+    sql.assert_within_budget(categories.delete_category)